@@ -0,0 +1,120 @@
+"""Benchmark CSV parsing and daily counting of AppsFlyer exports.
+
+Compares the old line-split loop used by the analyses with the
+vectorized pipeline (streamed batches + pandas parse + day slicing).
+
+    python benchmarks/bench_parsing.py [rows]
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from utils.csv_stream import aiter_csv_batches, batch_columns, column_index, parse_timestamps  # noqa: E402
+
+# Default column set of AppsFlyer raw-data v5 exports
+COLUMNS = [
+    'Attributed Touch Type', 'Attributed Touch Time', 'Install Time', 'Event Time',
+    'Event Name', 'Event Value', 'Event Revenue', 'Event Revenue Currency',
+    'Event Revenue USD', 'Event Source', 'Is Receipt Validated', 'Partner',
+    'Media Source', 'Channel', 'Keywords', 'Campaign', 'Campaign ID', 'Adset',
+    'Adset ID', 'Ad', 'Ad ID', 'Ad Type', 'Site ID', 'Sub Site ID',
+    'Sub Param 1', 'Sub Param 2', 'Sub Param 3', 'Sub Param 4', 'Sub Param 5',
+    'Cost Model', 'Cost Value', 'Cost Currency', 'Contributor 1 Partner',
+    'Contributor 1 Media Source', 'Contributor 1 Campaign',
+    'Contributor 1 Touch Type', 'Contributor 1 Touch Time',
+    'Contributor 2 Partner', 'Contributor 2 Media Source',
+    'Contributor 2 Campaign', 'Contributor 2 Touch Type',
+    'Contributor 2 Touch Time', 'Contributor 3 Partner',
+    'Contributor 3 Media Source', 'Contributor 3 Campaign',
+    'Contributor 3 Touch Type', 'Contributor 3 Touch Time', 'Region',
+    'Country Code', 'State', 'City', 'Postal Code', 'DMA', 'IP', 'WIFI',
+    'Operator', 'Carrier', 'Language', 'AppsFlyer ID', 'Advertising ID', 'IDFA',
+    'Android ID', 'Customer User ID', 'IMEI', 'IDFV', 'Platform', 'Device Type',
+    'OS Version', 'App Version', 'SDK Version', 'App ID', 'App Name', 'Bundle ID',
+    'Is Retargeting', 'Retargeting Conversion Type', 'Attribution Lookback',
+    'Reengagement Window', 'Is Primary Attribution', 'User Agent',
+    'HTTP Referrer', 'Original URL'
+]
+
+def make_export(rows: int, days: int = 30) -> bytes:
+    """Build synthetic export; every tenth row has a JSON event value with quoted commas"""
+    rng = np.random.default_rng(42)
+    start = np.datetime64('2024-01-01T00:00:00')
+    seconds = np.sort(rng.integers(0, days * 86400, rows))
+    times = np.char.replace((start + seconds.astype('timedelta64[s]')).astype(str), 'T', ' ')
+    sources = rng.choice(['Facebook Ads', 'googleadwords_int', 'tiktokglobal_int'], rows)
+    values = np.where(
+        np.arange(rows) % 10 == 0,
+        '"{""af_revenue"":""1.99"",""af_currency"":""USD""}"',
+        ''
+    )
+    # Columns after 'Cost Currency' are left empty, as in most real exports
+    padding = ',' * (len(COLUMNS) - COLUMNS.index('Cost Currency') - 1)
+    lines = [
+        f"click,{t},{t},{t},purchase,{v},1.99,USD,1.99,SDK,,,{s},,,"
+        f"winter_sale,123456,adset,654321,ad,111,,site,,,,,,,CPI,0.5,USD{padding}\n"
+        for t, s, v in zip(times, sources, values)
+    ]
+    return (','.join(COLUMNS) + '\n' + ''.join(lines)).encode('utf-8')
+
+def legacy_forecast_counts(data: bytes, from_date: str, to_date: str) -> pd.DataFrame:
+    """Old approach: split every line on commas and fill DataFrame cell by cell"""
+    text = data.decode('utf-8')
+    date_events = defaultdict(int)
+    for line in text.splitlines()[1:]:
+        parts = line.split(',')
+        if len(parts) >= 4:
+            date_events[parts[3].strip().split(' ')[0]] += 1
+
+    df = pd.DataFrame(index=pd.date_range(start=from_date, end=to_date), columns=['events'], data=0)
+    for date_str, count in date_events.items():
+        try:
+            date = pd.to_datetime(date_str)
+        except (ValueError, pd.errors.ParserError):
+            continue
+        if date in df.index:
+            df.loc[date, 'events'] = count
+    return df
+
+async def vectorized_counts(data: bytes, from_date: str, to_date: str) -> pd.Series:
+    """New approach: streamed batches, pandas C parser, bulk day counts"""
+    async def chunks():
+        for i in range(0, len(data), 64 * 1024):
+            yield data[i:i + 64 * 1024]
+
+    parts = []
+    async for batch in aiter_csv_batches(chunks()):
+        (times,) = batch_columns(batch, [column_index(batch.header, 'Event Time')])
+        times = parse_timestamps(times)
+        parts.append(times[~np.isnat(times)].astype('datetime64[D]'))
+    days = np.concatenate(parts)
+    day_range = np.arange(np.datetime64(from_date), np.datetime64(to_date) + 1)
+    counts = np.bincount((days - day_range[0]).astype(np.int64), minlength=len(day_range))
+    return pd.Series(counts[:len(day_range)], index=pd.DatetimeIndex(day_range))
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    data = make_export(rows)
+    print(f"rows: {rows}, export size: {len(data) / 1024 / 1024:.1f} MB")
+
+    started = time.perf_counter()
+    legacy = legacy_forecast_counts(data, '2024-01-01', '2024-01-30')
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    vectorized = asyncio.run(vectorized_counts(data, '2024-01-01', '2024-01-30'))
+    vectorized_time = time.perf_counter() - started
+
+    print(f"legacy line split:   {legacy_time:.2f}s, counted {int(legacy['events'].sum())} rows")
+    print(f"vectorized pipeline: {vectorized_time:.2f}s, counted {int(vectorized.sum())} rows")
+    print(f"speedup: {legacy_time / vectorized_time:.1f}x")
+
+if __name__ == '__main__':
+    main()
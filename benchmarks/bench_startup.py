@@ -0,0 +1,123 @@
+"""Benchmark bot startup: import time, memory and first /start response.
+
+Every measurement runs in a fresh interpreter, so imports are cold
+(apart from the OS file cache). The Telegram API is replaced by a local
+fake, so first-response latency covers only the bot's own work.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+# Modules imported by main.py before the bot can answer
+BOT_MODULES = [
+    'telegram.ext',
+    'database.repository',
+    'services.appsflyer_service',
+    'services.report_jobs',
+    'services.daily_sync',
+    'handlers.offer_handlers',
+    'handlers.report_handlers',
+    'handlers.analysis_handlers',
+    'utils.render_pool',
+    'utils.warm_up',
+]
+
+# Loaded by the first analysis unless warm-up did it
+ANALYTICS_MODULES = ['services.event_store']
+
+def _child():
+    started = time.perf_counter()
+    sys.path.insert(0, SRC)
+    import importlib
+    for name in BOT_MODULES:
+        importlib.import_module(name)
+    imported = time.perf_counter()
+
+    from telegram import Update
+    from telegram.ext import Application, CommandHandler
+    from telegram.request import BaseRequest
+
+    class FakeRequest(BaseRequest):
+        """Answers Bot API calls locally"""
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None):
+            user = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'}
+            result = user
+            if url.endswith('/sendMessage'):
+                result = {'message_id': 2, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': 'ok'}
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    async def start(update, context):
+        await update.message.reply_text("👋 Hello!")
+
+    async def first_response():
+        app = Application.builder().token('1:benchmark').request(FakeRequest()).build()
+        app.add_handler(CommandHandler('start', start))
+        await app.initialize()
+        update = Update.de_json({
+            'update_id': 1,
+            'message': {
+                'message_id': 1, 'date': 0, 'text': '/start',
+                'chat': {'id': 1, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'user'},
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}]
+            }
+        }, app.bot)
+        await app.process_update(update)
+        await app.shutdown()
+
+    asyncio.run(first_response())
+    responded = time.perf_counter()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    for name in ANALYTICS_MODULES:
+        importlib.import_module(name)
+    analytics = time.perf_counter()
+
+    print(json.dumps({
+        'import': imported - started,
+        'first_response': responded - started,
+        'rss_mb': rss,
+        'analytics_import': analytics - responded
+    }))
+
+def main():
+    if sys.argv[1:] == ['--child']:
+        _child()
+        return
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, __file__, '--child'], capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    def median(key):
+        return statistics.median(result[key] for result in results)
+
+    print(f"runs: {runs} (median)")
+    print(f"bot modules import:   {median('import'):.2f}s")
+    print(f"first /start handled: {median('first_response'):.2f}s after interpreter start")
+    print(f"peak RSS at response: {median('rss_mb'):.0f} MB")
+    print(f"lazy analytics load:  {median('analytics_import'):.2f}s (paid by warm-up or first analysis)")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
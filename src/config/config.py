@@ -9,8 +9,105 @@ APPSFLYER_API_KEY = 'eyJhbGciOiJBMjU2S1ciLCJjdHkiOiJKV1QiLCJlbmMiOiJBMjU2R0NNIiw
 APPSFLYER_APP_ID = 'id1388812308'
 APPSFLYER_BASE_URL = "https://hq1.appsflyer.com/api/raw-data/export/app"
 
+# Update delivery: 'polling' or 'webhook' (one or more replicas behind a load balancer)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # public HTTPS URL, its path is served locally
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # checked on every request; A-Z, a-z, 0-9, _ and -
+WEBHOOK_MAX_PENDING = 256  # unfinished updates (queued, waiting or running) before answering 503
+WEBHOOK_MAX_CONNECTIONS = 40  # parallel deliveries Telegram may open to one URL
+# Replicas sharing the webhook URL: internal base URLs of all of them (same order
+# on every replica) and the position of this one. Each user is owned by replica
+# user_id % count; updates reaching another replica are forwarded to the owner
+WEBHOOK_REPLICAS = [url.strip().rstrip('/') for url in os.getenv('WEBHOOK_REPLICAS', '').split(',') if url.strip()]
+WEBHOOK_REPLICA_INDEX = int(os.getenv('WEBHOOK_REPLICA_INDEX', '0'))
+WEBHOOK_FORWARD_TIMEOUT = 10  # seconds to wait for the owner replica to accept a forwarded update
+
+# Concurrent update processing; updates of one chat stay in order
+UPDATE_CONCURRENCY = 16  # handlers running at once
+UPDATE_MAX_IN_FLIGHT = 512  # updates inside the processor at once; admission is bounded by WEBHOOK_MAX_PENDING
+UPDATE_STATS_INTERVAL = 300  # seconds between queue metrics log lines
+
+# Outbound Bot API limits
+TELEGRAM_GLOBAL_RATE = 30  # messages per second to all chats
+TELEGRAM_CHAT_INTERVAL = 1.0  # seconds between messages to one private chat
+TELEGRAM_GROUP_INTERVAL = 3.0  # groups allow 20 messages per minute
+TELEGRAM_MAX_RETRIES = 3  # RetryAfter retries before the error reaches the caller
+
+# AppsFlyer HTTP client
+APPSFLYER_TIMEOUT = 30
+APPSFLYER_MAX_CONNECTIONS = 20
+APPSFLYER_MAX_KEEPALIVE = 10
+APPSFLYER_KEEPALIVE_EXPIRY = 60
+APPSFLYER_PER_HOST_LIMIT = 4
+APPSFLYER_RATE = 1.0  # requests per second per app and report endpoint
+APPSFLYER_BURST = 4
+APPSFLYER_MIN_RATE = 1 / 60
+APPSFLYER_QUOTA_BACKOFF = 60  # pause after 429 without Retry-After, seconds
+
+# Retries and circuit breaker for AppsFlyer requests
+APPSFLYER_RETRIES = 4  # attempts per request or date shard
+APPSFLYER_RETRY_BASE_DELAY = 1
+APPSFLYER_RETRY_MAX_DELAY = 30
+APPSFLYER_BREAKER_THRESHOLD = 5  # consecutive failures before failing fast
+APPSFLYER_BREAKER_COOLDOWN = 60
+
+# AppsFlyer export cache
+EXPORT_CACHE_DIR = 'cache/exports'
+EXPORT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+EXPORT_CACHE_CLOSED_TTL = 7 * 24 * 3600  # past days never change
+EXPORT_CACHE_OPEN_TTL = 10 * 60  # range includes today
+
+# Streaming downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+CSV_BATCH_BYTES = 1024 * 1024
+REPORT_SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+# Date-range sharding of exports
+APPSFLYER_SHARD_DAYS = 1
+APPSFLYER_SHARD_WORKERS = 4
+
+# Local columnar store of installs and in-app events
+EVENT_STORE_DIR = 'data/events'
+
+# Daily sync of event store from AppsFlyer
+SYNC_HOUR = 4  # Moscow time; yesterday's raw data is complete by then
+SYNC_BACKFILL_DAYS = 30  # days loaded for a new offer
+SYNC_STARTUP_DELAY = 60  # seconds after start to catch up on missed syncs
+
+# Chart rendering process pool
+RENDER_POOL_WORKERS = 2
+WARM_UP_ON_START = True  # load analytics stack and render workers right after start
+
+# Rendered analysis charts cache
+CHART_CACHE_MAX_ENTRIES = 256
+CHART_CACHE_CLOSED_TTL = 24 * 3600
+CHART_CACHE_OPEN_TTL = 10 * 60  # range includes today
+
+# Offers per page in offer lists and pickers
+OFFER_PAGE_SIZE = 10
+
+# Report jobs
+REPORT_WORKERS = 3  # reports generated at the same time
+REPORT_PER_USER_RUNNING = 1
+REPORT_PER_USER_QUEUED = 5
+REPORT_PROGRESS_INTERVAL = 3  # seconds between progress message edits
+REPORT_JOB_RETENTION_DAYS = 7  # finished job records are kept this long
+REPORT_COMPRESS_ABOVE = 5 * 1024 * 1024  # bigger reports are sent as .csv.gz
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 * 1024  # bot API document size limit
+
 # Database Configuration
 DATABASE_NAME = 'offers.db'
+DB_BUSY_TIMEOUT = 5.0  # seconds to wait for a lock held by another writer
+DB_CACHED_STATEMENTS = 256
+# Seconds before per-process caches read the database again; needed when several
+# replicas share it, since a write on one replica does not reach the others' caches
+ROLE_CACHE_TTL = 60 if len(WEBHOOK_REPLICAS) > 1 else None
+OFFER_CATALOG_TTL = 60 if len(WEBHOOK_REPLICAS) > 1 else None
+PERSISTENCE_UPDATE_INTERVAL = 5  # seconds between batched writes of conversation states and user_data
+PERSISTENCE_RETRY_DELAY = 1  # seconds before retrying a failed write, doubled up to the maximum
+PERSISTENCE_RETRY_MAX_DELAY = 60
 
 # Logging Configuration
 logging.basicConfig(
@@ -35,6 +132,14 @@ REPORT_TYPE_SELECT, REPORT_DATES, REPORT_EVENT_NAME, REPORT_FIELDS_SELECT, REPOR
     ANALYSIS_SOURCE_CHOICE, ANALYSIS_MEDIA_SOURCE, ANALYSIS_PARAMS
 ) = range(21, 27)
 
+OFFER_DAILY_LIMIT = 27
+
+(
+    EDIT_OFFER_NAME, EDIT_OFFER_DESC, EDIT_OFFER_PAYOUT, EDIT_OFFER_GEO,
+    EDIT_OFFER_VERTICAL, EDIT_OFFER_KPI, EDIT_OFFER_TRACKER, EDIT_OFFER_ANTIFRAUD,
+    EDIT_OFFER_APPSFLYER_ID, EDIT_OFFER_EVENT_NAME, EDIT_OFFER_DAILY_LIMIT
+) = range(28, 39)
+
 # Default Admin Username
 DEFAULT_ADMIN_USERNAME = '@immmortalangel'
 DEFAULT_ADMIN_ID = 507720214 
\ No newline at end of file
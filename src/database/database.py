@@ -1,39 +1,83 @@
 import sqlite3
+import threading
+import time
 from datetime import datetime
-from config.config import DATABASE_NAME, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_ID, logger
+from typing import Dict, Optional, Tuple
+from config.config import (
+    DATABASE_NAME, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_ID, logger,
+    DB_BUSY_TIMEOUT, DB_CACHED_STATEMENTS, ROLE_CACHE_TTL
+)
+from database.migrations import run_migrations
+
+# Columns of offers rows in SELECT * order
+OFFER_COLUMNS = (
+    'id', 'name', 'description', 'payout', 'geo', 'vertical', 'kpi', 'tracker',
+    'antifraud', 'created_at', 'appsflyer_offer_id', 'event_name', 'daily_limit'
+)
+
+# Offer columns that may be changed by update_offer_field
+OFFER_FIELDS = (
+    'name', 'description', 'payout', 'geo', 'vertical', 'kpi', 'tracker',
+    'antifraud', 'appsflyer_offer_id', 'event_name', 'daily_limit'
+)
+
+# Columns of report job records, in ReportJob constructor order
+REPORT_JOB_COLUMNS = (
+    'user_id', 'chat_id', 'message_id', 'report_type', 'offer_id', 'offer_name',
+    'app_id', 'event_name', 'date_from', 'date_to', 'additional_fields', 'job_id'
+)
+
+# One long-lived connection per thread, reused by all queries of that thread
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+def get_db_connection() -> sqlite3.Connection:
+    """Get persistent connection of current thread, opening it on first use"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(
+            DATABASE_NAME,
+            timeout=DB_BUSY_TIMEOUT,
+            cached_statements=DB_CACHED_STATEMENTS,
+            check_same_thread=False  # closed from main thread on shutdown
+        )
+        # WAL: readers do not block the writer and vice versa
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+# user_id -> (role, cached_at); roles change only through this module
+_role_cache: Dict[int, Tuple[str, float]] = {}
+
+def _cache_role(user_id: int, role: str):
+    _role_cache[user_id] = (role, time.monotonic())
+
+def load_role_cache():
+    """Load roles of all known users into memory"""
+    rows = get_db_connection().execute("SELECT user_id, role FROM users").fetchall()
+    _role_cache.clear()
+    for user_id, role in rows:
+        _cache_role(user_id, role or 'partner')
+    logger.info(f"Role cache loaded: {len(rows)} users")
+
+def close_db_connections():
+    """Close connections of all threads"""
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
 
 def init_database():
-    """Initialize database and create necessary tables"""
-    conn = sqlite3.connect(DATABASE_NAME)
+    """Initialize database: apply schema migrations and add default admin"""
+    conn = get_db_connection()
+    run_migrations(conn)
     c = conn.cursor()
-    
-    # Create offers table
-    c.execute('''CREATE TABLE IF NOT EXISTS offers
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT,
-                  description TEXT,
-                  payout REAL,
-                  geo TEXT,
-                  vertical TEXT,
-                  kpi TEXT,
-                  tracker TEXT,
-                  antifraud TEXT,
-                  created_at TIMESTAMP,
-                  appsflyer_offer_id TEXT,
-                  event_name TEXT)''')
-    
-    # Create users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (user_id INTEGER PRIMARY KEY,
-                  username TEXT,
-                  role TEXT DEFAULT 'partner',
-                  created_at TIMESTAMP)''')
-
-    # Check for event_name column
-    c.execute("PRAGMA table_info(offers)")
-    columns = [col[1] for col in c.fetchall()]
-    if 'event_name' not in columns:
-        c.execute("ALTER TABLE offers ADD COLUMN event_name TEXT")
 
     # Add default admin
     try:
@@ -43,94 +87,195 @@ def init_database():
         pass
 
     conn.commit()
-    conn.close()
+    load_role_cache()
+
+def cached_user_role(user_id: int) -> Optional[str]:
+    """Get user role from memory without touching the database; None when not cached"""
+    cached = _role_cache.get(user_id)
+    if cached is not None and (ROLE_CACHE_TTL is None or time.monotonic() - cached[1] < ROLE_CACHE_TTL):
+        return cached[0]
+    return None
 
 def get_user_role(user_id: int) -> str:
-    """Get user role from database"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute("SELECT role FROM users WHERE user_id=?", (user_id,))
-    role = c.fetchone()
-    conn.close()
-    return role[0] if role else 'partner'
+    """Get user role, from memory when cached"""
+    role = cached_user_role(user_id)
+    if role is not None:
+        return role
+
+    role = get_db_connection().execute("SELECT role FROM users WHERE user_id=?", (user_id,)).fetchone()
+    role = role[0] if role else 'partner'
+    _cache_role(user_id, role)
+    return role
 
 def add_offer_to_db(offer_data: dict):
     """Add new offer to database"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute('''INSERT INTO offers
-                 (name, description, payout, geo, vertical,
-                  kpi, tracker, antifraud, created_at, appsflyer_offer_id, event_name)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-              (offer_data['name'],
-               offer_data['description'],
-               offer_data['payout'],
-               offer_data['geo'],
-               offer_data['vertical'],
-               offer_data['kpi'],
-               offer_data['tracker'],
-               offer_data['antifraud'],
-               datetime.now(),
-               offer_data['appsflyer_offer_id'],
-               offer_data['event_name']))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        conn.execute('''INSERT INTO offers
+                        (name, description, payout, geo, vertical,
+                         kpi, tracker, antifraud, created_at, appsflyer_offer_id, event_name,
+                         daily_limit)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     (offer_data['name'],
+                      offer_data['description'],
+                      offer_data['payout'],
+                      offer_data['geo'],
+                      offer_data['vertical'],
+                      offer_data['kpi'],
+                      offer_data['tracker'],
+                      offer_data['antifraud'],
+                      datetime.now(),
+                      offer_data['appsflyer_offer_id'],
+                      offer_data['event_name'],
+                      offer_data.get('daily_limit')))
 
 def get_all_offers():
     """Get all offers from database"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM offers")
-    offers = c.fetchall()
-    conn.close()
-    return offers
+    return get_db_connection().execute("SELECT * FROM offers").fetchall()
+
+def get_offer_index():
+    """Get lightweight offer rows: id, name, payout, AppsFlyer id, event name"""
+    return get_db_connection().execute(
+        "SELECT id, name, payout, appsflyer_offer_id, event_name FROM offers ORDER BY id"
+    ).fetchall()
 
 def get_offer_details(offer_id: int):
     """Get specific offer details"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute("SELECT * FROM offers WHERE id=?", (offer_id,))
-    offer = c.fetchone()
-    conn.close()
-    return offer
+    return get_db_connection().execute("SELECT * FROM offers WHERE id=?", (offer_id,)).fetchone()
 
 def update_offer(offer_id: int, field: str, value: str):
     """Update specific offer field"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute(f"UPDATE offers SET {field}=? WHERE id=?", (value, offer_id))
-    conn.commit()
-    conn.close()
+    if field not in OFFER_FIELDS:
+        raise ValueError(f"Unknown offer field: {field}")
+    with get_db_connection() as conn:
+        conn.execute(f"UPDATE offers SET {field}=? WHERE id=?", (value, offer_id))
+
+# Name used by offer handlers
+update_offer_field = update_offer
+
+def update_offer_fields(offer_id: int, changes: dict):
+    """Update several offer fields in one statement and transaction"""
+    unknown = [field for field in changes if field not in OFFER_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown offer fields: {', '.join(unknown)}")
+    if not changes:
+        return
+    assignments = ', '.join(f"{field}=?" for field in changes)
+    with get_db_connection() as conn:
+        conn.execute(f"UPDATE offers SET {assignments} WHERE id=?", (*changes.values(), offer_id))
 
 def delete_offer(offer_id: int):
     """Delete offer from database"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute("DELETE FROM offers WHERE id=?", (offer_id,))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM offers WHERE id=?", (offer_id,))
 
 def update_user_role(username: str, new_role: str) -> bool:
     """Update user role in database"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE users SET role=? WHERE username=?", (new_role, username))
-    success = c.rowcount > 0
-    conn.commit()
-    conn.close()
-    return success
+    with get_db_connection() as conn:
+        c = conn.execute("UPDATE users SET role=? WHERE username=?", (new_role, username))
+        user_ids = conn.execute("SELECT user_id FROM users WHERE username=?", (username,)).fetchall()
+    for (user_id,) in user_ids:
+        _cache_role(user_id, new_role)
+    return c.rowcount > 0
 
 def create_user(user_id: int, username: str, role: str = 'partner'):
     """Create new user in database"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    c = conn.cursor()
     try:
-        c.execute('''INSERT INTO users
-                     (user_id, username, role, created_at)
-                     VALUES (?, ?, ?, ?)''',
-                 (user_id, username, role, datetime.now()))
-        conn.commit()
+        with get_db_connection() as conn:
+            conn.execute('''INSERT INTO users
+                            (user_id, username, role, created_at)
+                            VALUES (?, ?, ?, ?)''',
+                         (user_id, username, role, datetime.now()))
+        _cache_role(user_id, role)
     except sqlite3.IntegrityError:
         logger.warning(f"User {username} already exists")
-    finally:
-        conn.close() 
\ No newline at end of file
+
+def save_report_job(job: dict, status: str):
+    """Insert report job record"""
+    columns = REPORT_JOB_COLUMNS + ('status', 'created_at', 'updated_at')
+    now = datetime.now()
+    values = tuple(job[column] for column in REPORT_JOB_COLUMNS) + (status, now, now)
+    with get_db_connection() as conn:
+        conn.execute(
+            f"INSERT OR REPLACE INTO report_jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            values
+        )
+
+def set_report_job_status(job_id: str, status: str, error: str = None):
+    """Update status of report job"""
+    with get_db_connection() as conn:
+        conn.execute("UPDATE report_jobs SET status=?, error=?, updated_at=? WHERE job_id=?",
+                     (status, error, datetime.now(), job_id))
+
+def get_unfinished_report_jobs():
+    """Get records of queued and running report jobs, oldest first"""
+    return get_db_connection().execute(
+        f"SELECT {', '.join(REPORT_JOB_COLUMNS)} FROM report_jobs "
+        "WHERE status IN ('queued', 'running') ORDER BY created_at"
+    ).fetchall()
+
+def delete_finished_report_jobs(before: datetime):
+    """Remove records of finished jobs older than given time"""
+    with get_db_connection() as conn:
+        conn.execute("DELETE FROM report_jobs WHERE status NOT IN ('queued', 'running') AND updated_at < ?",
+                     (before,))
+
+def get_sync_watermark(app_id: str, kind: str, event_name: Optional[str]) -> Optional[str]:
+    """Get last day synced into event store, as YYYY-MM-DD"""
+    row = get_db_connection().execute(
+        "SELECT synced_through FROM sync_watermarks WHERE app_id=? AND kind=? AND event_name=?",
+        (app_id, kind, event_name or '')
+    ).fetchone()
+    return row[0] if row else None
+
+def set_sync_watermark(app_id: str, kind: str, event_name: Optional[str], synced_through: str):
+    """Record last day synced into event store"""
+    with get_db_connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO sync_watermarks VALUES (?, ?, ?, ?, ?)",
+                     (app_id, kind, event_name or '', synced_through, datetime.now()))
+
+def kv_load(namespace: str):
+    """Get (key, value, revision) rows of persistence namespace"""
+    return get_db_connection().execute(
+        "SELECT key, value, revision FROM kv_store WHERE namespace=?", (namespace,)
+    ).fetchall()
+
+def kv_get_changed(namespace: str, key: str, revision: Optional[str]):
+    """Get (value, revision) of key unless stored revision equals given one"""
+    return get_db_connection().execute(
+        "SELECT value, revision FROM kv_store WHERE namespace=? AND key=? AND revision IS NOT ?",
+        (namespace, key, revision)
+    ).fetchone()
+
+def kv_write(changes: list) -> list:
+    """Apply (namespace, key, value, revision, expected) changes in one transaction.
+
+    A change is applied only if the stored revision is still expected (None:
+    key must not exist); value None deletes key. Returns (namespace, key)
+    of changes skipped because another writer got there first.
+    """
+    now = datetime.now()
+    conflicts = []
+    with get_db_connection() as conn:
+        for namespace, key, value, revision, expected in changes:
+            if value is None:
+                cursor = conn.execute(
+                    "DELETE FROM kv_store WHERE namespace=? AND key=? AND revision IS ?",
+                    (namespace, key, expected)
+                )
+                applied = cursor.rowcount or not conn.execute(
+                    "SELECT 1 FROM kv_store WHERE namespace=? AND key=?", (namespace, key)
+                ).fetchone()
+            elif expected is None:
+                applied = conn.execute(
+                    "INSERT OR IGNORE INTO kv_store VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, value, revision, now)
+                ).rowcount
+            else:
+                applied = conn.execute(
+                    "UPDATE kv_store SET value=?, revision=?, updated_at=? "
+                    "WHERE namespace=? AND key=? AND revision=?",
+                    (value, revision, now, namespace, key, expected)
+                ).rowcount
+            if not applied:
+                conflicts.append((namespace, key))
+    return conflicts
\ No newline at end of file
@@ -0,0 +1,108 @@
+import sqlite3
+
+from config.config import logger
+
+def _add_column(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    """Add column unless a database created by older code already has it"""
+    columns = [col[1] for col in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _create_tables(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS offers
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     name TEXT,
+                     description TEXT,
+                     payout REAL,
+                     geo TEXT,
+                     vertical TEXT,
+                     kpi TEXT,
+                     tracker TEXT,
+                     antifraud TEXT,
+                     created_at TIMESTAMP,
+                     appsflyer_offer_id TEXT,
+                     event_name TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (user_id INTEGER PRIMARY KEY,
+                     username TEXT,
+                     role TEXT DEFAULT 'partner',
+                     created_at TIMESTAMP)''')
+    # Databases created before event_name was introduced
+    _add_column(conn, 'offers', 'event_name', 'TEXT')
+
+def _create_indexes(conn: sqlite3.Connection):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_offers_appsflyer ON offers (appsflyer_offer_id, event_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_offers_created_at ON offers (created_at)")
+
+def _add_daily_limit(conn: sqlite3.Connection):
+    _add_column(conn, 'offers', 'daily_limit', 'INTEGER')
+
+def _create_report_jobs(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS report_jobs
+                    (job_id TEXT PRIMARY KEY,
+                     user_id INTEGER,
+                     chat_id INTEGER,
+                     message_id INTEGER,
+                     report_type TEXT,
+                     offer_id INTEGER,
+                     offer_name TEXT,
+                     app_id TEXT,
+                     event_name TEXT,
+                     date_from TEXT,
+                     date_to TEXT,
+                     additional_fields TEXT,
+                     status TEXT,
+                     error TEXT,
+                     created_at TIMESTAMP,
+                     updated_at TIMESTAMP)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs (status, created_at)")
+
+def _create_sync_watermarks(conn: sqlite3.Connection):
+    # event_name is '' for installs
+    conn.execute('''CREATE TABLE IF NOT EXISTS sync_watermarks
+                    (app_id TEXT,
+                     kind TEXT,
+                     event_name TEXT,
+                     synced_through TEXT,
+                     updated_at TIMESTAMP,
+                     PRIMARY KEY (app_id, kind, event_name))''')
+
+def _create_kv_store(conn: sqlite3.Connection):
+    conn.execute('''CREATE TABLE IF NOT EXISTS kv_store
+                    (namespace TEXT,
+                     key TEXT,
+                     value BLOB,
+                     revision TEXT,
+                     updated_at TIMESTAMP,
+                     PRIMARY KEY (namespace, key))''')
+
+# (version, description, step); append new steps, never edit applied ones
+MIGRATIONS = [
+    (1, "create offers and users tables", _create_tables),
+    (2, "indexes on username, AppsFlyer id and created_at", _create_indexes),
+    (3, "offers.daily_limit column", _add_daily_limit),
+    (4, "report_jobs table", _create_report_jobs),
+    (5, "sync_watermarks table", _create_sync_watermarks),
+    (6, "kv_store table for bot persistence", _create_kv_store),
+]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def run_migrations(conn: sqlite3.Connection):
+    """Apply migrations newer than the schema version stored in the database"""
+    current = get_schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying migration {version}: {description}")
+        # Each step and its version bump commit together
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
\ No newline at end of file
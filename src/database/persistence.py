@@ -0,0 +1,262 @@
+import asyncio
+from abc import ABC, abstractmethod
+import json
+import pickle
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config.config import (
+    PERSISTENCE_UPDATE_INTERVAL, PERSISTENCE_RETRY_DELAY, PERSISTENCE_RETRY_MAX_DELAY, logger
+)
+from database import repository
+
+# (namespace, key, value, revision, expected revision); value None deletes key
+Change = Tuple[str, str, Optional[bytes], str, Optional[str]]
+
+class KeyValueStore(ABC):
+    """Shared storage of bot state: pickled values by namespace and key.
+
+    Every write stores a new revision, so a replica can tell that a key was
+    changed by someone else without comparing values. Writes are
+    compare-and-set: a change is applied only if the key still has the
+    revision the writer last saw (None: key must not exist). Deletes are
+    changes without value, so they are compare-and-set and batched too.
+    """
+
+    @abstractmethod
+    async def load(self, namespace: str) -> Dict[str, Tuple[bytes, str]]:
+        """Get all keys of namespace as key -> (value, revision)"""
+
+    @abstractmethod
+    async def get_changed(self, namespace: str, key: str,
+                          revision: Optional[str]) -> Optional[Tuple[bytes, str]]:
+        """Get (value, revision) of key if its stored revision differs from given one"""
+
+    @abstractmethod
+    async def write(self, changes: List[Change]) -> List[Tuple[str, str]]:
+        """Apply changes atomically; returns (namespace, key) of conflicting changes, which are skipped"""
+
+class SqliteKeyValueStore(KeyValueStore):
+    """Store in the bot database; replicas on one host or volume share it"""
+
+    async def load(self, namespace):
+        return {key: (value, revision) for key, value, revision in await repository.kv_load(namespace)}
+
+    async def get_changed(self, namespace, key, revision):
+        return await repository.kv_get_changed(namespace, key, revision)
+
+    async def write(self, changes):
+        return await repository.kv_write(changes)
+
+class MemoryKeyValueStore(KeyValueStore):
+    """In-process store; stands in for a network store in tests and local runs"""
+
+    def __init__(self):
+        self.data: Dict[Tuple[str, str], Tuple[bytes, str]] = {}
+        self.writes = 0
+
+    async def load(self, namespace):
+        return {key: item for (ns, key), item in self.data.items() if ns == namespace}
+
+    async def get_changed(self, namespace, key, revision):
+        item = self.data.get((namespace, key))
+        return item if item is not None and item[1] != revision else None
+
+    async def write(self, changes):
+        self.writes += 1
+        conflicts = []
+        for namespace, key, value, revision, expected in changes:
+            stored = self.data.get((namespace, key))
+            if value is None and stored is None:
+                continue
+            if (stored[1] if stored is not None else None) != expected:
+                conflicts.append((namespace, key))
+            elif value is None:
+                del self.data[(namespace, key)]
+            else:
+                self.data[(namespace, key)] = (value, revision)
+        return conflicts
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+
+def _conversation_namespace(name: str) -> str:
+    return f"conversation:{name}"
+
+class StorePersistence(BasePersistence):
+    """Persistence of conversation states, user_data and chat_data in a KeyValueStore.
+
+    The application hands over changed entries every update_interval; they
+    are pickled at once and written to the store in one batch. Before an
+    update is handled, its user_data and chat_data are reloaded if another
+    replica wrote a newer revision.
+
+    Conversation states are read from the store only when the application
+    starts. Several replicas can serve updates together because each user
+    is routed to one fixed replica (see utils.replicas): the owner's
+    in-memory states are always the current ones, and the store lets them
+    survive restarts and move when the set of replicas changes.
+
+    Writes are compare-and-set on the revision this replica last saw. A
+    conflict means another replica wrote the key, e.g. before the user was
+    routed here; the owner's live value is then written over it, so store
+    and memory agree again.
+    """
+
+    def __init__(self, store: KeyValueStore, update_interval: float = PERSISTENCE_UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval
+        )
+        self.store = store
+        # Revision of every key as last read or written by this replica
+        self._revisions: Dict[Tuple[str, str], str] = {}
+        self._dirty: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._writing: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+    async def _load(self, namespace: str) -> dict:
+        data = {}
+        for key, (value, revision) in (await self.store.load(namespace)).items():
+            self._revisions[(namespace, key)] = revision
+            data[key] = pickle.loads(value)
+        return data
+
+    def _mark(self, namespace: str, key: str, value):
+        """Snapshot changed value and schedule a batched write"""
+        self._dirty[(namespace, key)] = None if value is None else pickle.dumps(value)
+        if self._flush_task is None or self._flush_task.done():
+            # Application reports all changes of one round before this task runs
+            self._flush_task = asyncio.ensure_future(self._write_dirty())
+
+    async def _write_dirty(self):
+        """Write batches until nothing is dirty, including keys marked during a write"""
+        await asyncio.sleep(0)
+        if self._closing is None:
+            self._closing = asyncio.Event()
+        delay = PERSISTENCE_RETRY_DELAY
+        while self._dirty:
+            if await self._write_batch():
+                delay = PERSISTENCE_RETRY_DELAY
+                continue
+            if self._closing.is_set():
+                break
+            try:
+                # Back off from a failing store; shutdown interrupts the wait
+                await asyncio.wait_for(self._closing.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, PERSISTENCE_RETRY_MAX_DELAY)
+
+    async def _write_batch(self) -> bool:
+        """Write everything dirty in one batch; False if the store failed"""
+        batch, self._dirty = self._dirty, {}
+        self._writing = batch
+        changes = [
+            (namespace, key, value, uuid.uuid4().hex, self._revisions.get((namespace, key)))
+            for (namespace, key), value in batch.items()
+        ]
+        try:
+            conflicts = set(await self.store.write(changes))
+        except Exception as e:
+            logger.error(f"Persisting {len(changes)} bot state entries failed: {str(e)}")
+            # Retry with the next batch unless the key changed again meanwhile
+            for key, value in batch.items():
+                self._dirty.setdefault(key, value)
+            return False
+        finally:
+            self._writing = {}
+
+        for namespace, key, value, revision, _ in changes:
+            if (namespace, key) in conflicts:
+                # Write again on top of the stored revision unless changed meanwhile
+                try:
+                    stored = await self.store.get_changed(namespace, key, None)
+                except Exception as e:
+                    logger.error(f"Reading conflicting bot state entry failed: {str(e)}")
+                    stored = None
+                if stored is not None:
+                    self._revisions[(namespace, key)] = stored[1]
+                else:
+                    self._revisions.pop((namespace, key), None)
+                self._dirty.setdefault((namespace, key), value)
+            elif value is None:
+                self._revisions.pop((namespace, key), None)
+            else:
+                self._revisions[(namespace, key)] = revision
+        if conflicts:
+            logger.warning(f"{len(conflicts)} bot state entries were changed by another replica, "
+                           f"writing this replica's version over them")
+        logger.debug(f"Persisted {len(changes) - len(conflicts)} bot state entries")
+        return True
+
+    async def _refresh(self, namespace: str, key: str, data: dict):
+        """Replace data in place with newer revision written by another replica"""
+        if (namespace, key) in self._dirty or (namespace, key) in self._writing:
+            return
+        changed = await self.store.get_changed(namespace, key, self._revisions.get((namespace, key)))
+        if changed is not None:
+            value, revision = changed
+            data.clear()
+            data.update(pickle.loads(value))
+            self._revisions[(namespace, key)] = revision
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        return {int(key): value for key, value in (await self._load(USER_DATA)).items()}
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {int(key): value for key, value in (await self._load(CHAT_DATA)).items()}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        data = await self._load(_conversation_namespace(name))
+        return {tuple(json.loads(key)): state for key, state in data.items()}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        self._mark(_conversation_namespace(name), json.dumps(list(key)), new_state)
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._mark(USER_DATA, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._mark(CHAT_DATA, str(chat_id), data)
+
+    async def update_bot_data(self, data: dict):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._mark(USER_DATA, str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark(CHAT_DATA, str(chat_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._refresh(USER_DATA, str(user_id), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._refresh(CHAT_DATA, str(chat_id), chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    async def flush(self):
+        """Write pending changes on shutdown, with one last attempt if the store keeps failing"""
+        if self._closing is None:
+            self._closing = asyncio.Event()
+        self._closing.set()
+        if self._flush_task is not None:
+            await self._flush_task
+        await self._write_dirty()
+        if self._dirty:
+            logger.error(f"{len(self._dirty)} bot state entries could not be persisted before shutdown")
\ No newline at end of file
@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from database import database
+
+# All queries run on one dedicated thread: the event loop never touches
+# the disk and writes are serialized without "database is locked" retries
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+async def get_user_role(user_id: int) -> str:
+    """Get user role; cached roles are returned without leaving the event loop"""
+    role = database.cached_user_role(user_id)
+    if role is not None:
+        return role
+    return await _run(database.get_user_role, user_id)
+
+async def add_offer_to_db(offer_data: dict):
+    """Add new offer to database"""
+    await _run(database.add_offer_to_db, offer_data)
+
+async def get_all_offers():
+    """Get all offers from database"""
+    return await _run(database.get_all_offers)
+
+async def get_offer_index():
+    """Get lightweight offer rows: id, name, payout, AppsFlyer id, event name"""
+    return await _run(database.get_offer_index)
+
+async def get_offer_details(offer_id: int):
+    """Get specific offer details"""
+    return await _run(database.get_offer_details, offer_id)
+
+async def update_offer_field(offer_id: int, field: str, value):
+    """Update specific offer field"""
+    await _run(database.update_offer_field, offer_id, field, value)
+
+async def update_offer_fields(offer_id: int, changes: dict):
+    """Update several offer fields in one transaction"""
+    await _run(database.update_offer_fields, offer_id, changes)
+
+async def delete_offer(offer_id: int):
+    """Delete offer from database"""
+    await _run(database.delete_offer, offer_id)
+
+async def update_user_role(username: str, new_role: str) -> bool:
+    """Update user role in database"""
+    return await _run(database.update_user_role, username, new_role)
+
+async def create_user(user_id: int, username: str, role: str = 'partner'):
+    """Create new user in database"""
+    await _run(database.create_user, user_id, username, role)
+
+async def save_report_job(job: dict, status: str):
+    """Insert report job record"""
+    await _run(database.save_report_job, job, status)
+
+async def set_report_job_status(job_id: str, status: str, error: str = None):
+    """Update status of report job"""
+    await _run(database.set_report_job_status, job_id, status, error)
+
+async def get_unfinished_report_jobs():
+    """Get records of queued and running report jobs, oldest first"""
+    return await _run(database.get_unfinished_report_jobs)
+
+async def delete_finished_report_jobs(before):
+    """Remove records of finished jobs older than given time"""
+    await _run(database.delete_finished_report_jobs, before)
+
+async def get_sync_watermark(app_id: str, kind: str, event_name):
+    """Get last day synced into event store, as YYYY-MM-DD"""
+    return await _run(database.get_sync_watermark, app_id, kind, event_name)
+
+async def set_sync_watermark(app_id: str, kind: str, event_name, synced_through: str):
+    """Record last day synced into event store"""
+    await _run(database.set_sync_watermark, app_id, kind, event_name, synced_through)
+
+async def kv_load(namespace: str):
+    """Get (key, value, revision) rows of persistence namespace"""
+    return await _run(database.kv_load, namespace)
+
+async def kv_get_changed(namespace: str, key: str, revision):
+    """Get (value, revision) of key unless stored revision equals given one"""
+    return await _run(database.kv_get_changed, namespace, key, revision)
+
+async def kv_write(changes: list) -> list:
+    """Apply changes whose expected revision is still stored; returns conflicting keys"""
+    return await _run(database.kv_write, changes)
+
+async def close():
+    """Close connection of the database thread and stop it"""
+    await _run(database.close_db_connections)
+    _executor.shutdown(wait=True)
\ No newline at end of file
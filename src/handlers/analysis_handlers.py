@@ -1,13 +1,17 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from config.config import *
-from database.database import *
-from services.appsflyer_service import get_appsflyer_raw_data_custom
+from database.repository import get_offer_details
 from utils.report_utils import (
     generate_conversion_analysis,
     generate_revenue_forecast,
     generate_trend_analysis
 )
+from utils.render_pool import render
+from services.chart_cache import chart_cache, make_chart_key
+from services.offer_catalog import offer_catalog, parse_page_cursor
+from services.circuit_breaker import CircuitOpenError
+from utils.keyboards import offer_page_keyboard
 from datetime import datetime
 
 async def start_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -27,20 +31,28 @@ async def process_analysis_type(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     context.user_data['analysis_type'] = query.data.split('_')[1]
     
-    offers = get_all_offers()
-    keyboard = [
-        [InlineKeyboardButton(offer[1], callback_data=f"analysis_offer_{offer[0]}")]
-        for offer in offers
-    ]
+    await _show_analysis_offers(query)
+    return ANALYSIS_OFFER_SELECT
+
+async def _show_analysis_offers(query, cursor: int = None):
+    """Show page of offers to pick for analysis"""
+    page = await offer_catalog.page(cursor)
     await query.edit_message_text(
         "Select offer for analysis:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=offer_page_keyboard(
+            page, 'analysis',
+            lambda offer: [InlineKeyboardButton(offer.name, callback_data=f"analysis_offer_{offer.id}")]
+        )
     )
-    return ANALYSIS_OFFER_SELECT
 
 async def select_analysis_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
+    is_page, cursor = parse_page_cursor(query.data, 'analysis')
+    if is_page:
+        await _show_analysis_offers(query, cursor)
+        return ANALYSIS_OFFER_SELECT
+
     offer_id = int(query.data.split('_')[2])
     context.user_data['analysis_offer_id'] = offer_id
     
@@ -130,59 +142,76 @@ async def perform_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("❌ Analysis data lost")
         return ConversationHandler.END
 
-    offer = get_offer_details(offer_id)
+    offer = await get_offer_details(offer_id)
     if not offer or not offer[10] or not offer[11]:
         await query.edit_message_text("❌ Offer not found or missing AppsFlyer ID/Event Name")
         return ConversationHandler.END
 
+    # Loads NumPy and pandas on first analysis unless warm-up already did
+    from services.event_store import event_store, KIND_INSTALLS, KIND_EVENTS
+
     try:
-        params = {
-            'app_id': offer[10],
-            'from': analysis_dates['from'],
-            'to': analysis_dates['to'],
-            'media_source': media_source if media_source != 'all' else None
-        }
+        app_id = offer[10]
+        source_filter = media_source if media_source != 'all' else None
+        chart_key = make_chart_key(
+            offer, analysis_type, media_source, analysis_dates['from'], analysis_dates['to']
+        )
+        cached = chart_cache.get(chart_key)
+
+        if cached is not None:
+            # Re-send already uploaded image by file_id, or cached bytes
+            graph = cached.file_id or cached.png
 
-        if analysis_type == 'conversion':
+        elif analysis_type == 'conversion':
             # Get installs and events data
-            installs_endpoint = f"{APPSFLYER_BASE_URL}/{offer[10]}/installs_report/v5"
-            events_endpoint = f"{APPSFLYER_BASE_URL}/{offer[10]}/in_app_events_report/v5"
-            
-            installs_data = get_appsflyer_raw_data_custom(installs_endpoint, params)
-            events_params = params.copy()
-            events_params['event_name'] = offer[11]
-            events_data = get_appsflyer_raw_data_custom(events_endpoint, events_params)
+            installs_count = await event_store.count(
+                app_id, KIND_INSTALLS, None,
+                analysis_dates['from'], analysis_dates['to'], source_filter
+            )
+            events_count = await event_store.count(
+                app_id, KIND_EVENTS, offer[11],
+                analysis_dates['from'], analysis_dates['to'], source_filter
+            )
             
-            graph = generate_conversion_analysis(
-                installs_data.decode("utf-8"),
-                events_data.decode("utf-8"),
+            graph = await render(
+                generate_conversion_analysis,
+                installs_count,
+                events_count,
                 offer[1],
                 (analysis_dates['from'], analysis_dates['to'])
             )
 
         elif analysis_type == 'forecast':
-            events_endpoint = f"{APPSFLYER_BASE_URL}/{offer[10]}/in_app_events_report/v5"
-            params['event_name'] = offer[11]
-            events_data = get_appsflyer_raw_data_custom(events_endpoint, params)
+            daily_events = await event_store.daily_counts(
+                app_id, KIND_EVENTS, offer[11],
+                analysis_dates['from'], analysis_dates['to'], source_filter
+            )
             
-            graph = generate_revenue_forecast(
-                events_data.decode("utf-8"),
+            graph = await render(
+                generate_revenue_forecast,
+                daily_events,
                 offer[3],  # payout
                 (analysis_dates['from'], analysis_dates['to'])
             )
 
         elif analysis_type == 'trends':
-            installs_endpoint = f"{APPSFLYER_BASE_URL}/{offer[10]}/installs_report/v5"
-            installs_data = get_appsflyer_raw_data_custom(installs_endpoint, params)
+            daily_installs = await event_store.daily_counts(
+                app_id, KIND_INSTALLS, None,
+                analysis_dates['from'], analysis_dates['to'], source_filter
+            )
             
-            graph = generate_trend_analysis(
-                installs_data.decode("utf-8"),
+            graph = await render(
+                generate_trend_analysis,
+                daily_installs,
                 (analysis_dates['from'], analysis_dates['to']),
                 offer[1]
             )
 
+        if cached is None:
+            chart_cache.put(chart_key, graph.getvalue(), analysis_dates['to'])
+
         source_info = f"Source: {media_source}" if media_source != 'all' else "All sources"
-        await context.bot.send_photo(
+        message = await context.bot.send_photo(
             chat_id=update.effective_chat.id,
             photo=graph,
             caption=f"📊 Analysis Result ({analysis_type})\n"
@@ -190,7 +219,12 @@ async def perform_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"Source: {source_info}\n"
                     f"Period: {analysis_dates['from']} - {analysis_dates['to']}"
         )
+        if message.photo and (cached is None or cached.file_id is None):
+            chart_cache.set_file_id(chart_key, message.photo[-1].file_id)
 
+    except CircuitOpenError as e:
+        logger.warning(f"Analysis rejected: {str(e)}")
+        await query.edit_message_text("⚠️ AppsFlyer is temporarily unavailable. Try again later.")
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
         await query.edit_message_text("❌ Error performing analysis")
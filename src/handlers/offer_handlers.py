@@ -1,12 +1,63 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from config.config import *
-from database.database import get_user_role, get_offer_details, add_offer_to_db, update_offer_field, get_all_offers, get_db_connection
+from database.database import OFFER_COLUMNS
+from database.repository import get_user_role, get_offer_details, add_offer_to_db, update_offer_fields, update_user_role
+from database.repository import delete_offer as delete_offer_from_db
+from services.chart_cache import chart_cache
+from services.offer_catalog import offer_catalog, parse_page_cursor
+from utils.keyboards import offer_page_keyboard
 import validators
 
 async def is_admin(user_id: int) -> bool:
     """Check if user has admin rights"""
-    return get_user_role(user_id) == 'admin'
+    return await get_user_role(user_id) == 'admin'
+
+def _offer_changed(offer_id: int):
+    """Drop cached data derived from offer after it was edited or deleted"""
+    chart_cache.invalidate_offer(offer_id)
+    offer_catalog.invalidate()
+
+def _staged_offer(context: ContextTypes.DEFAULT_TYPE) -> tuple:
+    """Offer row being edited with unsaved changes applied"""
+    offer = list(context.user_data['editing_offer'])
+    offer += [None] * (len(OFFER_COLUMNS) - len(offer))
+    for field, value in context.user_data.get('editing_changes', {}).items():
+        offer[OFFER_COLUMNS.index(field)] = value
+    return tuple(offer)
+
+async def _stage_edit(update: Update, context: ContextTypes.DEFAULT_TYPE, field: str, value, label: str):
+    """Remember edited field until the session is saved and show edit menu again"""
+    context.user_data.setdefault('editing_changes', {})[field] = value
+    await update.message.reply_text(f"✏️ {label} changed. Press Save to apply.")
+    return await start_edit_offer(update, context)
+
+async def save_offer_edits(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Apply all staged changes of edit session in one transaction"""
+    query = update.callback_query
+    offer_id = context.user_data.get('editing_offer_id')
+    changes = context.user_data.get('editing_changes')
+    if not offer_id or not changes:
+        await query.edit_message_text("Nothing to save.")
+        return ConversationHandler.END
+
+    try:
+        await update_offer_fields(offer_id, changes)
+    except Exception as e:
+        logger.error(f"Error saving offer {offer_id}: {str(e)}")
+        await query.edit_message_text(f"❌ Error saving offer: {str(e)}")
+        return ConversationHandler.END
+
+    context.user_data['editing_offer'] = _staged_offer(context)
+    context.user_data['editing_changes'] = {}
+    _offer_changed(offer_id)
+    await query.edit_message_text(
+        "✅ Offer updated!",
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("← Back to offers", callback_data="offers_list")]
+        ])
+    )
+    return ConversationHandler.END
 
 async def start_add_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not await is_admin(update.effective_user.id):
@@ -104,7 +155,8 @@ async def process_offer_daily_limit(update: Update, context: ContextTypes.DEFAUL
             'daily_limit': context.user_data['daily_limit']
         }
         print(f"Debug: Final offer_data: {offer_data}")
-        add_offer_to_db(offer_data)
+        await add_offer_to_db(offer_data)
+        offer_catalog.invalidate()
         await update.message.reply_text("✅ Offer successfully added!")
         return ConversationHandler.END
     except ValueError:
@@ -113,34 +165,30 @@ async def process_offer_daily_limit(update: Update, context: ContextTypes.DEFAUL
 
 async def list_offers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    role = get_user_role(user_id)
-    offers = get_all_offers()
-    
-    print(f"Debug: Retrieved {len(offers) if offers else 0} offers")
-    if offers:
-        print(f"Debug: First offer: {offers[0]}")
+    role = await get_user_role(user_id)
+    cursor = None
+    if update.callback_query:
+        _, cursor = parse_page_cursor(update.callback_query.data, 'offers')
+    page = await offer_catalog.page(cursor)
 
-    if not offers:
+    if not page.offers:
         if update.callback_query:
             await update.callback_query.edit_message_text("No active offers.")
         else:
             await update.message.reply_text("No active offers.")
         return
 
-    keyboard = []
-    for offer in offers:
-        btn_text = f"{offer[1]} (${offer[3]})"
+    def offer_row(offer):
+        btn_text = f"{offer.name} (${offer.payout})"
         if role == 'admin':
-            row = [
-                InlineKeyboardButton(btn_text, callback_data=f"offer_view_{offer[0]}"),
-                InlineKeyboardButton("✏️ Edit", callback_data=f"offer_edit_{offer[0]}"),
-                InlineKeyboardButton("❌ Delete", callback_data=f"offer_delete_{offer[0]}")
+            return [
+                InlineKeyboardButton(btn_text, callback_data=f"offer_view_{offer.id}"),
+                InlineKeyboardButton("✏️ Edit", callback_data=f"offer_edit_{offer.id}"),
+                InlineKeyboardButton("❌ Delete", callback_data=f"offer_delete_{offer.id}")
             ]
-        else:
-            row = [InlineKeyboardButton(btn_text, callback_data=f"offer_view_{offer[0]}")]
-        keyboard.append(row)
+        return [InlineKeyboardButton(btn_text, callback_data=f"offer_view_{offer.id}")]
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = offer_page_keyboard(page, 'offers', offer_row)
     
     if update.callback_query:
         await update.callback_query.edit_message_text(
@@ -158,7 +206,7 @@ async def show_offer_details(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
 
     offer_id = int(query.data.split('_')[2])
-    offer = get_offer_details(offer_id)
+    offer = await get_offer_details(offer_id)
 
     if offer:
         text = f"""
@@ -197,17 +245,21 @@ async def start_edit_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Error: No offer selected for editing.")
             return ConversationHandler.END
     
-    offer = get_offer_details(offer_id)
-    
-    if not offer:
-        if update.callback_query:
-            await update.callback_query.edit_message_text("Offer not found")
-        else:
-            await update.message.reply_text("Offer not found")
-        return ConversationHandler.END
-    
-    context.user_data['editing_offer_id'] = offer_id
-    context.user_data['editing_offer'] = offer
+    if update.callback_query or context.user_data.get('editing_offer') is None:
+        # New edit session: load offer once, later steps use the staged copy
+        offer = await get_offer_details(offer_id)
+        if not offer:
+            if update.callback_query:
+                await update.callback_query.edit_message_text("Offer not found")
+            else:
+                await update.message.reply_text("Offer not found")
+            return ConversationHandler.END
+        context.user_data['editing_offer_id'] = offer_id
+        context.user_data['editing_offer'] = offer
+        context.user_data['editing_changes'] = {}
+
+    offer = _staged_offer(context)
+    changes = context.user_data['editing_changes']
     
     keyboard = [
         [InlineKeyboardButton("Name", callback_data="edit_name")],
@@ -220,15 +272,22 @@ async def start_edit_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [InlineKeyboardButton("Anti-fraud", callback_data="edit_antifraud")],
         [InlineKeyboardButton("AppsFlyer ID", callback_data="edit_appsflyer")],
         [InlineKeyboardButton("Event Name", callback_data="edit_event")],
-        [InlineKeyboardButton("Daily Limit", callback_data="edit_daily_limit")],
-        [InlineKeyboardButton("← Back", callback_data="offers_list")]
+        [InlineKeyboardButton("Daily Limit", callback_data="edit_daily_limit")]
     ]
+    if changes:
+        keyboard.append([
+            InlineKeyboardButton("💾 Save", callback_data="edit_save"),
+            InlineKeyboardButton("↩️ Discard", callback_data="edit_discard")
+        ])
+    keyboard.append([InlineKeyboardButton("← Back", callback_data="offers_list")])
     
     text = f"""
     📝 Editing offer: *{offer[1]}*
     
     Select what you want to edit:
     """
+    if changes:
+        text += f"\n    ✏️ Unsaved changes: {len(changes)}. Press Save to apply them.\n"
     
     if update.callback_query:
         await update.callback_query.edit_message_text(
@@ -249,8 +308,19 @@ async def handle_edit_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    choice = query.data.split('_')[1]
-    offer = context.user_data['editing_offer']
+    choice = query.data.split('_', 1)[1]
+
+    if choice == 'save':
+        return await save_offer_edits(update, context)
+    if choice == 'discard':
+        context.user_data['editing_changes'] = {}
+        await query.edit_message_text(
+            "↩️ Changes discarded.",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("← Back to offers", callback_data="offers_list")]
+            ])
+        )
+        return ConversationHandler.END
     
     edit_prompts = {
         'name': ("Enter new offer name:", EDIT_OFFER_NAME),
@@ -276,27 +346,18 @@ async def handle_edit_choice(update: Update, context: ContextTypes.DEFAULT_TYPE)
 async def process_edit_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer name"""
     new_name = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'name', new_name)
-    await update.message.reply_text("✅ Offer name updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'name', new_name, "Name")
 
 async def process_edit_desc(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer description"""
     new_desc = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'description', new_desc)
-    await update.message.reply_text("✅ Offer description updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'description', new_desc, "Description")
 
 async def process_edit_payout(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer payout"""
     try:
         new_payout = float(update.message.text)
-        offer_id = context.user_data['editing_offer_id']
-        update_offer_field(offer_id, 'payout', new_payout)
-        await update.message.reply_text("✅ Offer payout updated!")
-        return await start_edit_offer(update, context)
+        return await _stage_edit(update, context, 'payout', new_payout, "Payout")
     except ValueError:
         await update.message.reply_text("Please enter a valid number for payout. Try again:")
         return EDIT_OFFER_PAYOUT
@@ -304,58 +365,37 @@ async def process_edit_payout(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def process_edit_geo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer GEO"""
     new_geo = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'geo', new_geo)
-    await update.message.reply_text("✅ Offer GEO updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'geo', new_geo, "GEO")
 
 async def process_edit_vertical(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer vertical"""
     new_vertical = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'vertical', new_vertical)
-    await update.message.reply_text("✅ Offer vertical updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'vertical', new_vertical, "Vertical")
 
 async def process_edit_kpi(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer KPI"""
     new_kpi = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'kpi', new_kpi)
-    await update.message.reply_text("✅ Offer KPI updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'kpi', new_kpi, "KPI")
 
 async def process_edit_tracker(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer tracker"""
     new_tracker = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'tracker', new_tracker)
-    await update.message.reply_text("✅ Offer tracker updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'tracker', new_tracker, "Tracker")
 
 async def process_edit_antifraud(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer anti-fraud"""
     new_antifraud = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'antifraud', new_antifraud)
-    await update.message.reply_text("✅ Offer anti-fraud updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'antifraud', new_antifraud, "Anti-fraud")
 
 async def process_edit_appsflyer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer AppsFlyer ID"""
     new_appsflyer = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'appsflyer_offer_id', new_appsflyer)
-    await update.message.reply_text("✅ Offer AppsFlyer ID updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'appsflyer_offer_id', new_appsflyer, "AppsFlyer ID")
 
 async def process_edit_event(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer event name"""
     new_event = update.message.text
-    offer_id = context.user_data['editing_offer_id']
-    update_offer_field(offer_id, 'event_name', new_event)
-    await update.message.reply_text("✅ Offer event name updated!")
-    return await start_edit_offer(update, context)
+    return await _stage_edit(update, context, 'event_name', new_event, "Event name")
 
 async def process_edit_daily_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Process edited offer daily limit"""
@@ -364,10 +404,7 @@ async def process_edit_daily_limit(update: Update, context: ContextTypes.DEFAULT
         if new_limit <= 0:
             await update.message.reply_text("Please enter a positive number for daily limit. Try again:")
             return EDIT_OFFER_DAILY_LIMIT
-        offer_id = context.user_data['editing_offer_id']
-        update_offer_field(offer_id, 'daily_limit', new_limit)
-        await update.message.reply_text("✅ Offer daily limit updated!")
-        return await start_edit_offer(update, context)
+        return await _stage_edit(update, context, 'daily_limit', new_limit, "Daily limit")
     except ValueError:
         await update.message.reply_text("Please enter a valid number for daily limit. Try again:")
         return EDIT_OFFER_DAILY_LIMIT
@@ -378,7 +415,7 @@ async def delete_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     offer_id = int(query.data.split('_')[2])
-    offer = get_offer_details(offer_id)
+    offer = await get_offer_details(offer_id)
     
     if not offer:
         await query.edit_message_text("Offer not found")
@@ -403,7 +440,7 @@ async def confirm_delete_offer(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     offer_id = int(query.data.split('_')[2])
-    offer = get_offer_details(offer_id)
+    offer = await get_offer_details(offer_id)
     
     if not offer:
         await query.edit_message_text("Offer not found")
@@ -411,11 +448,8 @@ async def confirm_delete_offer(update: Update, context: ContextTypes.DEFAULT_TYP
     
     try:
         # Delete offer from database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM offers WHERE id = ?", (offer_id,))
-        conn.commit()
-        conn.close()
+        await delete_offer_from_db(offer_id)
+        _offer_changed(offer_id)
         
         await query.edit_message_text(
             f"✅ Offer has been deleted successfully.",
@@ -436,8 +470,8 @@ async def handle_offer_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    if query.data == "offers_list":
-        # Return to offers list
+    if query.data == "offers_list" or query.data.startswith("offers_page_"):
+        # Return to offers list or switch its page
         await list_offers(update, context)
     elif query.data.startswith("offer_view_"):
         # Show offer details
@@ -467,7 +501,7 @@ async def grant_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     target_username = context.args[0].lstrip('@')
-    success = update_user_role(target_username, 'admin')
+    success = await update_user_role(target_username, 'admin')
 
     if not success:
         await update.message.reply_text("❌ User not found.")
@@ -1,11 +1,11 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from config.config import *
-from database.database import *
-from services.appsflyer_service import get_appsflyer_raw_data_custom, get_post_attribution_report
-from utils.report_utils import generate_report
+from database.repository import get_offer_details
+from services.report_jobs import ReportJob, QueueFull, report_queue
+from services.offer_catalog import offer_catalog, parse_page_cursor
+from utils.keyboards import offer_page_keyboard
 from handlers.offer_handlers import is_admin
-from io import BytesIO
 from datetime import datetime
 import logging
 
@@ -120,23 +120,25 @@ async def process_dates(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Invalid date format. Use YYYY-MM-DD")
         return REPORT_DATES
 
-    offers = get_all_offers()
-    if not offers:
+    page = await offer_catalog.page()
+    if not page.offers:
         await update.message.reply_text("❌ No available offers")
         return ConversationHandler.END
 
-    keyboard = [
-        [InlineKeyboardButton(f"{offer[1]}", callback_data=f"report_offer_{offer[0]}")]
-        for offer in offers
-    ]
-    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="report_cancel")])
-
     await update.message.reply_text(
         "📋 Select offer from list:",
-        reply_markup=InlineKeyboardMarkup(keyboard)
+        reply_markup=_report_offers_keyboard(page)
     )
     return REPORT_SELECT_OFFER
 
+def _report_offers_keyboard(page):
+    """Build keyboard for page of offers to pick for report"""
+    return offer_page_keyboard(
+        page, 'report',
+        lambda offer: [InlineKeyboardButton(f"{offer.name}", callback_data=f"report_offer_{offer.id}")],
+        [[InlineKeyboardButton("❌ Cancel", callback_data="report_cancel")]]
+    )
+
 async def select_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -144,67 +146,51 @@ async def select_offer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query.data == "report_cancel":
         await query.edit_message_text("❌ Report generation cancelled")
         return ConversationHandler.END
+
+    is_page, cursor = parse_page_cursor(query.data, 'report')
+    if is_page:
+        await query.edit_message_text(
+            "📋 Select offer from list:",
+            reply_markup=_report_offers_keyboard(await offer_catalog.page(cursor))
+        )
+        return REPORT_SELECT_OFFER
         
     offer_id = int(query.data.split('_')[2])
-    offer = get_offer_details(offer_id)
+    offer = await get_offer_details(offer_id)
     
     if not offer:
         await query.edit_message_text("❌ Offer not found")
         return ConversationHandler.END
         
-    try:
-        # Отправляем сообщение о начале обработки
-        processing_message = await query.edit_message_text("⏳ Processing your report... This may take a few moments.")
-        
-        report_type = context.user_data.get('report_type')
-        appsflyer_offer_id = offer[10]
-        event_name = offer[11]
-        
-        logger.info(f"Generating report of type: {report_type}")
-        logger.info(f"Offer ID: {offer_id}, AppsFlyer ID: {appsflyer_offer_id}")
-        
-        params = {
-            'from': context.user_data['date_from'],
-            'to': context.user_data['date_to'],
-            'app_id': appsflyer_offer_id
-        }
-        
-        logger.info(f"Report parameters: {params}")
-        
-        csv_data = None
-        
-        if report_type == 'events':
-            params['event_name'] = context.user_data.get('event_name', event_name)
-            endpoint = f"{APPSFLYER_BASE_URL}/{appsflyer_offer_id}/in_app_events_report/v5"
-            logger.info(f"Events endpoint: {endpoint}")
-            csv_data = get_appsflyer_raw_data_custom(endpoint, params)
-        elif report_type == 'installs':
-            endpoint = f"{APPSFLYER_BASE_URL}/{appsflyer_offer_id}/installs_report/v5"
-            logger.info(f"Installs endpoint: {endpoint}")
-            csv_data = get_appsflyer_raw_data_custom(endpoint, params)
-        elif report_type == 'post_attribution':
-            logger.info("Getting post-attribution report")
-            csv_data = get_post_attribution_report(params)
-            
-        if not csv_data:
-            logger.warning(f"No data received for report type: {report_type}")
-            await processing_message.edit_text(f"⚠️ No data for period {params['from']} - {params['to']}")
-            return ConversationHandler.END
-            
-        logger.info(f"Successfully received data, size: {len(csv_data)} bytes")
-        
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=BytesIO(csv_data),
-            filename=f"{report_type}_{params['from']}_to_{params['to']}.csv",
-            caption=f"📊 Report for: {offer[1]}\nType: {report_type}"
+    report_type = context.user_data.get('report_type')
+    appsflyer_offer_id = offer[10]
+    logger.info(f"Queueing report of type: {report_type}")
+    logger.info(f"Offer ID: {offer_id}, AppsFlyer ID: {appsflyer_offer_id}")
+
+    # Sent before submitting: once queued, a free worker may edit this message at once
+    ahead = report_queue.turns_ahead(update.effective_user.id)
+    if ahead:
+        processing_message = await query.edit_message_text(
+            f"⏳ Report queued, {ahead} ahead of it. You can keep using the bot."
         )
-        
-        # Удаляем сообщение о процессе после успешной отправки
-        await processing_message.delete()
-        
-    except Exception as e:
-        logger.error(f"Error generating report: {str(e)}")
-        await processing_message.edit_text("❌ Error generating report")
-        
-    return ConversationHandler.END 
\ No newline at end of file
+    else:
+        processing_message = await query.edit_message_text("⏳ Report queued...")
+    job = ReportJob(
+        user_id=update.effective_user.id,
+        chat_id=update.effective_chat.id,
+        message_id=processing_message.message_id,
+        report_type=report_type,
+        offer_id=offer_id,
+        offer_name=offer[1],
+        app_id=appsflyer_offer_id,
+        event_name=context.user_data.get('event_name', offer[11]),
+        date_from=context.user_data['date_from'],
+        date_to=context.user_data['date_to'],
+        additional_fields=context.user_data.get('additional_fields')
+    )
+
+    try:
+        await report_queue.submit(job)
+    except QueueFull:
+        await processing_message.edit_text("🚫 Too many reports in queue. Wait for previous reports to finish.")
+    return ConversationHandler.END
\ No newline at end of file
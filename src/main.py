@@ -1,3 +1,5 @@
+import asyncio
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
 from telegram.ext import (
     Application,
@@ -10,7 +12,9 @@ from telegram.ext import (
 )
 
 from config.config import (
-    TELEGRAM_TOKEN, logger,
+    TELEGRAM_TOKEN, WARM_UP_ON_START, BOT_MODE, WEBHOOK_MAX_PENDING,
+    UPDATE_CONCURRENCY, UPDATE_MAX_IN_FLIGHT, UPDATE_STATS_INTERVAL,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, TELEGRAM_GROUP_INTERVAL, TELEGRAM_MAX_RETRIES, logger,
     OFFER_NAME, OFFER_DESC, OFFER_PAYOUT, OFFER_GEO,
     OFFER_VERTICAL, OFFER_KPI, OFFER_TRACKER, OFFER_ANTIFRAUD,
     OFFER_APPSFLYER_ID, OFFER_EVENT_NAME, OFFER_DAILY_LIMIT,
@@ -26,6 +30,16 @@ from config.config import (
     EDIT_OFFER_APPSFLYER_ID, EDIT_OFFER_EVENT_NAME, EDIT_OFFER_DAILY_LIMIT
 )
 from database.database import init_database
+from database import repository
+from database.persistence import StorePersistence, SqliteKeyValueStore
+from services.appsflyer_service import close_client
+from utils.render_pool import shutdown_render_pool
+from utils.warm_up import warm_up
+from utils.update_processor import PerChatUpdateProcessor, UpdateQueue
+from utils.replicas import is_primary, replica_count
+from utils.telegram_rate_limiter import PriorityRateLimiter
+from services.report_jobs import report_queue
+from services.daily_sync import schedule_daily_sync
 from handlers.offer_handlers import (
     start_add_offer, process_offer_name, process_offer_desc,
     process_offer_payout, process_offer_geo, process_offer_vertical,
@@ -99,11 +113,27 @@ async def handle_message(update, context):
 
 def main():
     """Start the bot."""
+    if BOT_MODE != 'webhook' and replica_count() > 1:
+        raise RuntimeError("Several replicas need webhook mode: Telegram allows one polling client")
+
     # Initialize database
     init_database()
 
     # Create application
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Conversation states and user_data live in the shared store, not in process memory
+    builder = Application.builder().token(TELEGRAM_TOKEN).persistence(StorePersistence(SqliteKeyValueStore()))
+    # Long analyses of one user no longer delay other chats
+    update_queue = UpdateQueue(maxsize=WEBHOOK_MAX_PENDING if BOT_MODE == 'webhook' else 0)
+    update_processor = PerChatUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_MAX_IN_FLIGHT, update_queue)
+    builder = builder.update_queue(update_queue).concurrent_updates(update_processor)
+    # Outgoing messages are paced to Telegram limits instead of hitting flood control
+    builder = builder.rate_limiter(PriorityRateLimiter(
+        TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, TELEGRAM_GROUP_INTERVAL, TELEGRAM_MAX_RETRIES
+    ))
+    if BOT_MODE == 'webhook':
+        # Updates come from our own server, which applies backpressure
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Add offer conversation handler
     add_offer_conv = ConversationHandler(
@@ -156,7 +186,7 @@ def main():
         },
         fallbacks=[CommandHandler('cancel', cancel)],
         name="add_offer_conversation",
-        persistent=False
+        persistent=True
     )
 
     # Add edit offer conversation handler
@@ -213,7 +243,7 @@ def main():
             CallbackQueryHandler(handle_edit_choice, pattern=r'^edit_.*$')
         ],
         name="edit_offer_conversation",
-        persistent=False
+        persistent=True
     )
 
     # Add report conversation handler
@@ -251,7 +281,7 @@ def main():
         },
         fallbacks=[CommandHandler('cancel', cancel)],
         name="report_conversation",
-        persistent=False
+        persistent=True
     )
 
     # Add analysis conversation handler
@@ -285,7 +315,7 @@ def main():
         },
         fallbacks=[CommandHandler('cancel', cancel)],
         name="analysis_conversation",
-        persistent=False
+        persistent=True
     )
 
     # Traffic Source Management
@@ -299,7 +329,9 @@ def main():
             SOURCE_GEO: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_source_geo)],
             SOURCE_PERFORMANCE: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_source_performance)]
         },
-        fallbacks=[CommandHandler('cancel', lambda u, c: ConversationHandler.END)]
+        fallbacks=[CommandHandler('cancel', lambda u, c: ConversationHandler.END)],
+        name="source_conversation",
+        persistent=True
     )
     
     # Source management handlers
@@ -320,6 +352,7 @@ def main():
     # Offer management callback handlers
     application.add_handler(CallbackQueryHandler(handle_offer_callback, pattern=r'^offer_.*$'))
     application.add_handler(CallbackQueryHandler(handle_offer_callback, pattern='^offers_list$'))
+    application.add_handler(CallbackQueryHandler(handle_offer_callback, pattern=r'^offers_page_\d+$'))
     application.add_handler(CallbackQueryHandler(handle_offer_callback, pattern=r'^confirm_delete_\d+$'))
     
     # Source edit message handlers
@@ -347,12 +380,35 @@ def main():
     async def post_init(app: Application) -> None:
         """Post initialization hook to set up commands."""
         await app.bot.set_my_commands(commands)
+        if WARM_UP_ON_START:
+            # Not awaited: polling starts while libraries load
+            app.create_task(warm_up(), name='warm_up')
+        await report_queue.start(app.bot)
+        if app.job_queue is not None:
+            if is_primary():
+                # One replica syncs the event store shared by all of them
+                schedule_daily_sync(app.job_queue)
+            app.job_queue.run_repeating(update_processor.log_stats, UPDATE_STATS_INTERVAL, name='update_stats')
+        else:
+            logger.warning("JobQueue is not available, daily sync disabled")
+
+    async def post_shutdown(app: Application) -> None:
+        """Post shutdown hook to stop report workers and release AppsFlyer connections, render workers and database."""
+        await report_queue.stop()
+        await close_client()
+        shutdown_render_pool()
+        await repository.close()
 
     application.post_init = post_init
+    application.post_shutdown = post_shutdown
 
     # Start the bot
-    print("Starting bot...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    print(f"Starting bot ({BOT_MODE})...")
+    if BOT_MODE == 'webhook':
+        from utils.webhook_server import run_webhook
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     try:
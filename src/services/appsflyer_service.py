@@ -1,68 +1,437 @@
-import requests
-from config.config import APPSFLYER_API_KEY, APPSFLYER_APP_ID, APPSFLYER_BASE_URL, logger
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+from typing import IO, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
 
-def get_appsflyer_raw_data_custom(endpoint: str, params: dict) -> bytes:
-    """Get raw data from AppsFlyer API"""
-    headers = {
-        "Authorization": f"Bearer {APPSFLYER_API_KEY}",
-        "Accept": "text/csv"
-    }
+import httpx
+
+from config.config import (
+    APPSFLYER_API_KEY, APPSFLYER_APP_ID, APPSFLYER_BASE_URL, logger,
+    APPSFLYER_TIMEOUT, APPSFLYER_MAX_CONNECTIONS, APPSFLYER_MAX_KEEPALIVE,
+    APPSFLYER_KEEPALIVE_EXPIRY, APPSFLYER_PER_HOST_LIMIT,
+    DOWNLOAD_CHUNK_SIZE, REPORT_SPOOL_MAX_MEMORY,
+    APPSFLYER_SHARD_DAYS, APPSFLYER_SHARD_WORKERS, APPSFLYER_RETRIES,
+    APPSFLYER_RETRY_BASE_DELAY, APPSFLYER_RETRY_MAX_DELAY
+)
+from services.circuit_breaker import CircuitOpenError, get_breaker
+from services.export_cache import export_cache, make_cache_key
+from services.rate_limit import get_bucket, parse_retry_after
+from utils.async_utils import run_blocking
+
+# Shared client: one connection pool with keep-alive for all handlers
+_client: Optional[httpx.AsyncClient] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+# Downloads in progress by cache key; identical requests wait for them
+_inflight: Dict[str, asyncio.Future] = {}
+
+def get_client() -> httpx.AsyncClient:
+    """Get shared AppsFlyer HTTP client, creating it on first use"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {APPSFLYER_API_KEY}",
+                "Accept": "text/csv",
+                # CSV compresses well; httpx decodes the body while streaming
+                "Accept-Encoding": "gzip, deflate"
+            },
+            timeout=httpx.Timeout(APPSFLYER_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=APPSFLYER_MAX_CONNECTIONS,
+                max_keepalive_connections=APPSFLYER_MAX_KEEPALIVE,
+                keepalive_expiry=APPSFLYER_KEEPALIVE_EXPIRY
+            )
+        )
+    return _client
+
+async def close_client():
+    """Close shared HTTP client and release pooled connections"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _host_semaphore(endpoint: str) -> asyncio.Semaphore:
+    """Get concurrency limiter for endpoint host"""
+    host = urlsplit(endpoint).netloc
+    if host not in _host_semaphores:
+        _host_semaphores[host] = asyncio.Semaphore(APPSFLYER_PER_HOST_LIMIT)
+    return _host_semaphores[host]
+
+def _clean_params(params: dict) -> dict:
+    """Drop empty filters: None values mean "no filter" and must not be sent to AppsFlyer"""
+    return {key: value for key, value in params.items() if value is not None}
 
+def _raw_data_params(params: dict) -> dict:
+    """Apply default parameters of raw-data export requests"""
     # Default parameters
     default_params = {
         'app_id': APPSFLYER_APP_ID,
         'timezone': 'Europe/Moscow'
     }
     params.update(default_params)
+    return params
 
+def post_attribution_endpoint(app_id: str) -> str:
+    """Get post-attribution export endpoint for app"""
+    return f"{APPSFLYER_BASE_URL}/{app_id}/fraud-post-inapps/v5"
+
+async def _iter_file(path: str) -> AsyncIterator[bytes]:
+    """Read file in chunks without blocking the event loop"""
+    f = await run_blocking(open, path, 'rb')
     try:
-        logger.info(f"Sending request to: {endpoint}")
-        logger.info(f"Parameters: {params}")
+        while True:
+            chunk = await run_blocking(f.read, DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await run_blocking(f.close)
+
+async def _iter_cached(cache_key: str) -> Optional[AsyncIterator[bytes]]:
+    """Get reader of cached export body or None"""
+    cached_path = await run_blocking(export_cache.get_path, cache_key)
+    if cached_path is None:
+        return None
+    return _iter_file(cached_path)
+
+async def stream_export(endpoint: str, params: dict) -> AsyncIterator[bytes]:
+    """Stream export body in chunks, serving it from cache when possible.
+
+    Concurrent identical requests share one download: followers wait for
+    the leader to finish and then read the body from the export cache.
+    """
+    cache_key = make_cache_key(endpoint, params)
+    while cache_key in _inflight:
+        logger.info(f"Waiting for identical download of {endpoint}")
+        await asyncio.shield(_inflight[cache_key])
+        cached = await _iter_cached(cache_key)
+        if cached is not None:
+            yielded = False
+            try:
+                async for chunk in cached:
+                    yielded = True
+                    yield chunk
+                return
+            except FileNotFoundError:
+                # Evicted before the first chunk: download it again
+                if yielded:
+                    raise
+
+    # Registered before the first await, so later identical requests follow this one
+    done = asyncio.get_running_loop().create_future()
+    _inflight[cache_key] = done
+    try:
+        cached = await _iter_cached(cache_key)
+        if cached is not None:
+            logger.info(f"Export cache hit for {endpoint}: {export_cache.stats()}")
+            yielded = False
+            try:
+                async for chunk in cached:
+                    yielded = True
+                    yield chunk
+                return
+            except FileNotFoundError:
+                # Evicted between lookup and read; a partly sent body cannot be restarted
+                if yielded:
+                    raise
+
+        async for chunk in _download_export(endpoint, params, cache_key):
+            yield chunk
+    except httpx.HTTPError as e:
+        # Followers fail with the same error instead of repeating the request
+        done.set_exception(e)
+        done.exception()
+        raise
+    finally:
+        del _inflight[cache_key]
+        if not done.done():
+            done.set_result(None)
+
+async def _download_export(endpoint: str, params: dict, cache_key: str) -> AsyncIterator[bytes]:
+    """Download export body from AppsFlyer, teeing it into the export cache"""
+    logger.info(f"Sending request to: {endpoint}")
+    logger.info(f"Parameters: {params}")
+
+    bucket = get_bucket(endpoint)
+    breaker = get_breaker(endpoint)
+    breaker.check()
+    answered = False
+    tmp_path = export_cache.temp_path(cache_key)
+    cache_file = await run_blocking(open, tmp_path, 'wb')
+    completed = False
+    try:
+        await bucket.acquire()
+        async with _host_semaphore(endpoint):
+            async with get_client().stream('GET', endpoint, params=_clean_params(params)) as response:
+                answered = True
+                if response.status_code >= 500:
+                    breaker.failure()
+                else:
+                    breaker.success()
+                if response.status_code == 429:
+                    bucket.penalize(parse_retry_after(response.headers.get('Retry-After')))
+                response.raise_for_status()
+                bucket.reward()
+                size = 0
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    await run_blocking(cache_file.write, chunk)
+                    yield chunk
+        completed = True
+        logger.info(f"Downloaded {size} bytes from {endpoint}")
+    except httpx.TransportError:
+        if not answered:
+            breaker.failure()
+            answered = True
+        raise
+    finally:
+        if not answered:
+            breaker.abandon()
+        await run_blocking(cache_file.close)
+        if completed:
+            await run_blocking(export_cache.commit_file, cache_key, tmp_path, params)
+        else:
+            await run_blocking(os.remove, tmp_path)
+
+def split_date_range(date_from: str, date_to: str, shard_days: int) -> List[Tuple[str, str]]:
+    """Split inclusive date range into consecutive shards of shard_days days"""
+    try:
+        start = datetime.strptime(date_from, "%Y-%m-%d").date()
+        end = datetime.strptime(date_to, "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        # Time-of-day ranges are fetched as a single request
+        return [(date_from, date_to)]
+
+    shards = []
+    while start <= end:
+        shard_end = min(start + timedelta(days=shard_days - 1), end)
+        shards.append((start.isoformat(), shard_end.isoformat()))
+        start = shard_end + timedelta(days=1)
+    return shards
+
+def _is_retryable(error: Exception) -> bool:
+    """Check if failed request may succeed when repeated"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so retries of many shards do not line up"""
+    return random.uniform(0, min(APPSFLYER_RETRY_MAX_DELAY, APPSFLYER_RETRY_BASE_DELAY * 2 ** attempt))
+
+async def _stream_with_retry(endpoint: str, params: dict) -> AsyncIterator[bytes]:
+    """Stream export, repeating the request on transient errors until first byte is received"""
+    for attempt in range(1, APPSFLYER_RETRIES + 1):
+        received = False
+        try:
+            async for chunk in stream_export(endpoint, params):
+                received = True
+                yield chunk
+            return
+        except httpx.HTTPError as e:
+            # Body already partially sent to consumer: cannot repeat transparently
+            if received or attempt == APPSFLYER_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning(f"Request to {endpoint} failed ({e}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def _fetch_shard(endpoint: str, params: dict, shard: Tuple[str, str], path: str):
+    """Download single date shard into file, retrying only this shard"""
+    shard_params = dict(params, **{'from': shard[0], 'to': shard[1]})
+    for attempt in range(1, APPSFLYER_RETRIES + 1):
+        f = await run_blocking(open, path, 'wb')
+        try:
+            async for chunk in stream_export(endpoint, shard_params):
+                await run_blocking(f.write, chunk)
+            return
+        except httpx.HTTPError as e:
+            if attempt == APPSFLYER_RETRIES or not _is_retryable(e):
+                raise
+            delay = _retry_delay(attempt)
+            logger.warning(f"Shard {shard[0]} - {shard[1]} failed ({e}), retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        finally:
+            await run_blocking(f.close)
+
+async def _iter_shard_body(path: str, skip_header: bool) -> AsyncIterator[bytes]:
+    """Read shard file, optionally dropping its header line"""
+    # Header has no quoted newlines, so it ends on the first one
+    header = b'' if skip_header else None
+    async for chunk in _iter_file(path):
+        if header is not None:
+            header += chunk
+            newline = header.find(b'\n')
+            if newline == -1:
+                continue
+            chunk, header = header[newline + 1:], None
+        if chunk:
+            yield chunk
+
+async def stream_sharded_export(endpoint: str, params: dict,
+                                shard_days: int = APPSFLYER_SHARD_DAYS,
+                                max_workers: int = APPSFLYER_SHARD_WORKERS) -> AsyncIterator[bytes]:
+    """Fetch export as date shards in parallel and stream them merged in date order"""
+    shards = split_date_range(params.get('from'), params.get('to'), shard_days)
+    if len(shards) == 1:
+        async for chunk in _stream_with_retry(endpoint, params):
+            yield chunk
+        return
 
-        response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-        response.raise_for_status()
-        return response.content
+    logger.info(f"Fetching {endpoint} as {len(shards)} shards")
+    workdir = await run_blocking(tempfile.mkdtemp, '', 'af_shards_')
+    workers = asyncio.Semaphore(max_workers)
 
-    except requests.exceptions.RequestException as e:
+    async def fetch(index: int, shard: Tuple[str, str]) -> str:
+        path = os.path.join(workdir, f"{index:05d}.csv")
+        async with workers:
+            await _fetch_shard(endpoint, params, shard, path)
+        return path
+
+    tasks = [asyncio.ensure_future(fetch(i, shard)) for i, shard in enumerate(shards)]
+    try:
+        header_sent = False
+        last_byte = b'\n'
+        for task in tasks:
+            path = await task
+            if not await run_blocking(os.path.getsize, path):
+                continue
+            first = True
+            async for chunk in _iter_shard_body(path, skip_header=header_sent):
+                if first and last_byte != b'\n':
+                    # Previous shard ended without newline: keep its last record apart
+                    yield b'\n'
+                first = False
+                yield chunk
+                last_byte = chunk[-1:]
+            header_sent = True
+            await run_blocking(os.remove, path)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await run_blocking(shutil.rmtree, workdir, True)
+
+# Called with (bytes, rows) downloaded so far
+ProgressCallback = Callable[[int, int], None]
+
+class SpooledExport(NamedTuple):
+    """Downloaded export: file rewound to start, CSV size and whether file holds gzip of it"""
+    file: Optional[IO[bytes]]
+    size: int
+    compressed: bool = False
+
+def _gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+def _spool_chunk(spool: IO[bytes], compressor, chunk: bytes):
+    spool.write(compressor.compress(chunk) if compressor is not None else chunk)
+
+def _flush_spool(spool: IO[bytes], compressor):
+    spool.write(compressor.flush())
+
+def _compress_spool(source: IO[bytes], target: IO[bytes], compressor):
+    """Compress everything written to source so far into target"""
+    source.seek(0)
+    while True:
+        block = source.read(DOWNLOAD_CHUNK_SIZE * 16)
+        if not block:
+            break
+        target.write(compressor.compress(block))
+
+async def spool_export(endpoint: str, params: dict, progress: Optional[ProgressCallback] = None,
+                       compress_above: Optional[int] = None) -> SpooledExport:
+    """Download export into temporary file.
+
+    Once the body grows beyond compress_above bytes, the part spooled so
+    far is gzipped and the rest of the stream goes straight into the
+    compressor, so big reports are never stored uncompressed.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_MEMORY)
+    compressor = None
+    size = 0
+    lines = 0
+    try:
+        async for chunk in stream_sharded_export(endpoint, params):
+            size += len(chunk)
+            if compressor is None and compress_above is not None and size > compress_above:
+                raw, spool = spool, tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_MEMORY)
+                compressor = _gzip_compressor()
+                try:
+                    await run_blocking(_compress_spool, raw, spool, compressor)
+                finally:
+                    raw.close()
+            await run_blocking(_spool_chunk, spool, compressor, chunk)
+            if progress is not None:
+                lines += chunk.count(b'\n')
+                progress(size, max(lines - 1, 0))  # without header
+        if compressor is not None:
+            await run_blocking(_flush_spool, spool, compressor)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return SpooledExport(spool, size, compressor is not None)
+
+async def stream_appsflyer_raw_data(endpoint: str, params: dict) -> AsyncIterator[bytes]:
+    """Stream raw data from AppsFlyer API"""
+    params = _raw_data_params(params)
+    try:
+        async for chunk in stream_sharded_export(endpoint, params):
+            yield chunk
+    except httpx.HTTPError as e:
         logger.error(f"Request error: {str(e)}")
         raise
 
-def get_post_attribution_report(params: dict) -> bytes:
-    """Get post-attribution report from AppsFlyer"""
-    endpoint = f"{APPSFLYER_BASE_URL}/{params['app_id']}/fraud-post-inapps/v5"
-    headers = {
-        "Authorization": f"Bearer {APPSFLYER_API_KEY}",
-        "Accept": "text/csv"
-    }
-    
+async def spool_appsflyer_raw_data(endpoint: str, params: dict, progress: Optional[ProgressCallback] = None,
+                                   compress_above: Optional[int] = None) -> SpooledExport:
+    """Download raw data from AppsFlyer API into temporary file"""
+    params = _raw_data_params(params)
+    try:
+        return await spool_export(endpoint, params, progress, compress_above)
+    except httpx.HTTPError as e:
+        logger.error(f"Request error: {str(e)}")
+        raise
+
+async def get_appsflyer_raw_data_custom(endpoint: str, params: dict) -> bytes:
+    """Get raw data from AppsFlyer API"""
+    return b''.join([chunk async for chunk in stream_appsflyer_raw_data(endpoint, params)])
+
+async def spool_post_attribution_report(params: dict, progress: Optional[ProgressCallback] = None,
+                                        compress_above: Optional[int] = None) -> SpooledExport:
+    """Download post-attribution report from AppsFlyer into temporary file"""
+    endpoint = post_attribution_endpoint(params['app_id'])
+
     # Добавляем параметры по умолчанию
     default_params = {
         'timezone': 'Europe/Moscow'
     }
     params.update(default_params)
-    
+
     try:
         logger.info(f"Sending post-attribution request to: {endpoint}")
-        logger.info(f"Parameters: {params}")
-        logger.info(f"Headers: {headers}")
-        
-        response = requests.get(endpoint, headers=headers, params=params, timeout=30)
-        logger.info(f"Response status code: {response.status_code}")
-        logger.info(f"Response headers: {response.headers}")
-        
-        response.raise_for_status()
-        
-        if not response.content:
+        export = await spool_export(endpoint, params, progress, compress_above)
+
+        if not export.size:
             logger.warning("Empty response received from post-attribution endpoint")
-            return None
-            
-        logger.info(f"Response content length: {len(response.content)} bytes")
-        return response.content
-        
-    except requests.exceptions.RequestException as e:
+            export.file.close()
+            return SpooledExport(None, 0)
+
+        logger.info(f"Response content length: {export.size} bytes")
+        return export
+
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Post-attribution request error: {str(e)}")
+        logger.error(f"Error response status: {e.response.status_code}")
+        raise
+    except httpx.HTTPError as e:
         logger.error(f"Post-attribution request error: {str(e)}")
-        if hasattr(e.response, 'text'):
-            logger.error(f"Error response: {e.response.text}")
         raise
     except Exception as e:
         logger.error(f"Unexpected error in post-attribution: {str(e)}")
@@ -89,4 +458,4 @@ def add_offer_filter(params: dict, offer_id: str) -> dict:
             'ad_personalization_enabled'
         ])
     })
-    return params 
\ No newline at end of file
+    return params
@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from config.config import CHART_CACHE_MAX_ENTRIES, CHART_CACHE_CLOSED_TTL, CHART_CACHE_OPEN_TTL, logger
+from services.export_cache import is_closed_range
+
+class CachedChart(NamedTuple):
+    """Rendered chart: PNG bytes and Telegram file_id once it was uploaded"""
+    png: bytes
+    file_id: Optional[str]
+    expires_at: float
+
+def make_chart_key(offer: tuple, analysis_type: str, media_source: str, date_from: str, date_to: str) -> tuple:
+    """Build cache key; offer fields used in rendering act as its version"""
+    # name, payout, appsflyer id, event name
+    return (offer[0], analysis_type, media_source, date_from, date_to,
+            offer[1], offer[3], offer[10], offer[11])
+
+class ChartCache:
+    """In-memory LRU cache of rendered analysis charts"""
+
+    def __init__(self, max_entries: int, closed_ttl: int, open_ttl: int):
+        self.max_entries = max_entries
+        self.closed_ttl = closed_ttl
+        self.open_ttl = open_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[CachedChart]:
+        """Get cached chart or None, marking entry as recently used"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.time():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, png: bytes, date_to: str):
+        """Store rendered chart; charts including today expire quickly"""
+        ttl = self.closed_ttl if is_closed_range({'to': date_to}) else self.open_ttl
+        with self._lock:
+            self._entries[key] = CachedChart(png, None, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_file_id(self, key: tuple, file_id: str):
+        """Remember Telegram file_id so the chart can be re-sent without uploading"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = entry._replace(file_id=file_id)
+
+    def invalidate_offer(self, offer_id: int):
+        """Drop all charts of offer after it was edited or deleted"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == offer_id]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"Dropped {len(stale)} cached charts of offer {offer_id}")
+
+    def stats(self) -> dict:
+        """Get cache counters"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+chart_cache = ChartCache(CHART_CACHE_MAX_ENTRIES, CHART_CACHE_CLOSED_TTL, CHART_CACHE_OPEN_TTL)
\ No newline at end of file
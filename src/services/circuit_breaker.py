@@ -0,0 +1,61 @@
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+from config.config import APPSFLYER_BREAKER_THRESHOLD, APPSFLYER_BREAKER_COOLDOWN, logger
+
+class CircuitOpenError(Exception):
+    """Upstream is considered down; request was not sent"""
+
+class CircuitBreaker:
+    """Fail fast after repeated upstream failures.
+
+    After `threshold` consecutive failures the circuit opens and requests
+    are rejected for `cooldown` seconds. Then one probe request is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def check(self):
+        """Raise CircuitOpenError unless request may be sent"""
+        if self._opened_at is None:
+            return
+        if time.monotonic() - self._opened_at < self.cooldown or self._probing:
+            raise CircuitOpenError(f"{self.name} is unavailable, retry later")
+        # Half-open: single probe request
+        self._probing = True
+
+    def success(self):
+        if self._opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def abandon(self):
+        """Request ended without telling whether upstream works (cancelled)"""
+        self._probing = False
+
+    def failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.threshold:
+            if self._opened_at is None or self._probing:
+                logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+# One breaker per upstream host
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    host = urlsplit(endpoint).netloc
+    if host not in _breakers:
+        _breakers[host] = CircuitBreaker(host, APPSFLYER_BREAKER_THRESHOLD, APPSFLYER_BREAKER_COOLDOWN)
+    return _breakers[host]
\ No newline at end of file
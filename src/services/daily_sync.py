@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+
+from telegram.ext import ContextTypes, JobQueue
+
+from config.config import SYNC_HOUR, SYNC_BACKFILL_DAYS, SYNC_STARTUP_DELAY, logger
+from database.repository import get_offer_index
+from services.circuit_breaker import CircuitOpenError
+from services.export_cache import MOSCOW_TZ
+
+async def sync_event_store(context: ContextTypes.DEFAULT_TYPE):
+    """Load installs and events of every offer up to yesterday into the event store"""
+    from services.event_store import event_store, KIND_INSTALLS, KIND_EVENTS
+
+    yesterday = datetime.now(MOSCOW_TZ).date() - timedelta(days=1)
+    streams = set()
+    for offer in await get_offer_index():
+        app_id, event_name = offer[3], offer[4]
+        if not app_id:
+            continue
+        streams.add((app_id, KIND_INSTALLS, None))
+        if event_name:
+            streams.add((app_id, KIND_EVENTS, event_name))
+
+    fetched = 0
+    for app_id, kind, event_name in sorted(streams, key=lambda s: (s[0], s[1], s[2] or '')):
+        try:
+            fetched += await event_store.sync(app_id, kind, event_name, yesterday, SYNC_BACKFILL_DAYS)
+        except CircuitOpenError as e:
+            # Remaining streams are picked up by the next run
+            logger.warning(f"Daily sync stopped: {str(e)}")
+            break
+        except Exception as e:
+            logger.error(f"Daily sync of {app_id} {kind} {event_name or ''} failed: {str(e)}")
+    logger.info(f"Daily sync through {yesterday}: {len(streams)} streams, {fetched} days fetched")
+
+def schedule_daily_sync(job_queue: JobQueue):
+    """Run sync every night and shortly after start to catch up on missed runs"""
+    job_queue.run_daily(sync_event_store, time(hour=SYNC_HOUR, tzinfo=MOSCOW_TZ), name='daily_sync')
+    job_queue.run_once(sync_event_store, SYNC_STARTUP_DELAY, name='startup_sync')
\ No newline at end of file
@@ -0,0 +1,301 @@
+import asyncio
+import os
+import re
+import weakref
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config.config import APPSFLYER_BASE_URL, EVENT_STORE_DIR, logger
+from database.repository import get_sync_watermark, set_sync_watermark
+from services.appsflyer_service import stream_appsflyer_raw_data
+from services.export_cache import MOSCOW_TZ
+from utils.async_utils import run_blocking
+from utils.csv_stream import CsvBatch, aiter_csv_batches, batch_columns, column_index, parse_timestamps
+
+# Export kinds and the timestamp column that places a row on a day
+KIND_INSTALLS = 'installs'
+KIND_EVENTS = 'events'
+
+_ENDPOINTS = {
+    KIND_INSTALLS: 'installs_report/v5',
+    KIND_EVENTS: 'in_app_events_report/v5'
+}
+_TIME_COLUMNS = {
+    KIND_INSTALLS: 'Install Time',
+    KIND_EVENTS: 'Event Time'
+}
+MEDIA_SOURCE_COLUMN = 'Media Source'
+# Day staged during a download, published when the download completes
+_STAGED_SUFFIX = '.part'
+
+def _safe_name(value: Optional[str]) -> str:
+    """Make partition directory name from app id or event name"""
+    if not value:
+        return '_all'
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', value)
+
+def _days(date_from: date, date_to: date) -> List[date]:
+    return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+def _day_runs(days: List[date]) -> List[Tuple[date, date]]:
+    """Group sorted days into contiguous (first, last) runs"""
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] + timedelta(days=1) == day:
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+class EventStore:
+    """Local columnar store of AppsFlyer installs and in-app events.
+
+    Rows are kept per app_id/kind/event_name/day as NumPy arrays: event
+    timestamps (datetime64[s]) and dictionary-encoded media sources.
+    Past days are downloaded once, by the daily sync or on first query;
+    today is always refreshed.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        # Entries go away with the last coroutine holding or waiting for the lock
+        self._locks = weakref.WeakValueDictionary()
+
+    def _lock(self, app_id: str, kind: str, event_name: Optional[str]) -> asyncio.Lock:
+        """Lock serializing downloads of one stream"""
+        lock = self._locks.get((app_id, kind, event_name))
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[(app_id, kind, event_name)] = lock
+        return lock
+
+    def _partition_dir(self, app_id: str, kind: str, event_name: Optional[str]) -> str:
+        return os.path.join(self.root, _safe_name(app_id), kind, _safe_name(event_name))
+
+    def _partition_path(self, app_id: str, kind: str, event_name: Optional[str], day: date) -> str:
+        return os.path.join(self._partition_dir(app_id, kind, event_name), f"{day.isoformat()}.npz")
+
+    def _is_complete(self, app_id: str, kind: str, event_name: Optional[str], day: date) -> bool:
+        """Check that partition of day was written after the day had ended"""
+        path = self._partition_path(app_id, kind, event_name, day)
+        day_end = datetime.combine(day + timedelta(days=1), time.min, MOSCOW_TZ).timestamp()
+        try:
+            return os.path.getmtime(path) >= day_end
+        except OSError:
+            return False
+
+    def missing_days(self, app_id: str, kind: str, event_name: Optional[str], days: List[date]) -> List[date]:
+        """Get days that have to be downloaded before querying"""
+        today = datetime.now(MOSCOW_TZ).date()
+        return [
+            day for day in days
+            if day >= today or not self._is_complete(app_id, kind, event_name, day)
+        ]
+
+    @staticmethod
+    def _save(path: str, times: np.ndarray, sources: np.ndarray):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        source_codes, source_values = pd.factorize(sources)
+        order = np.argsort(times, kind='stable')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                time=times[order].astype('datetime64[s]'),
+                source_codes=source_codes[order].astype(np.int32),
+                source_values=np.asarray(source_values, dtype=str)
+            )
+        os.replace(tmp_path, path)
+
+    def write_partition(self, app_id: str, kind: str, event_name: Optional[str], day: date,
+                        times: np.ndarray, sources: np.ndarray):
+        """Write one day of rows, replacing previous content"""
+        self._save(self._partition_path(app_id, kind, event_name, day), times, sources)
+
+    def read_partition(self, app_id: str, kind: str, event_name: Optional[str], day: date,
+                       media_source: Optional[str] = None) -> np.ndarray:
+        """Read event timestamps of one day, optionally filtered by media source"""
+        path = self._partition_path(app_id, kind, event_name, day)
+        if not os.path.exists(path):
+            return np.array([], dtype='datetime64[s]')
+        with np.load(path) as partition:
+            times = partition['time']
+            if media_source is None:
+                return times
+            matches = np.flatnonzero(
+                np.char.lower(partition['source_values']) == media_source.lower()
+            )
+            if not len(matches):
+                return times[:0]
+            return times[np.isin(partition['source_codes'], matches)]
+
+    @staticmethod
+    def _parse_batch(batch: CsvBatch, time_index: int, source_index: int):
+        """Convert batch of CSV records into timestamp and media source columns"""
+        times, sources = batch_columns(batch, [time_index, source_index])
+        times = parse_timestamps(times)
+        valid = ~np.isnat(times)
+        return times[valid], sources[valid]
+
+    def _stage_days(self, app_id: str, kind: str, event_name: Optional[str],
+                    buckets: Dict[date, List[Tuple[np.ndarray, np.ndarray]]]):
+        """Append buffered rows of each day to its staging file"""
+        for day, parts in buckets.items():
+            path = self._partition_path(app_id, kind, event_name, day) + _STAGED_SUFFIX
+            if os.path.exists(path):
+                # Rows of this day arrived out of order after it was staged
+                with np.load(path) as staged:
+                    parts = [(staged['time'], staged['source_values'][staged['source_codes']])] + parts
+            self._save(path, np.concatenate([t for t, _ in parts]), np.concatenate([s for _, s in parts]))
+
+    def _commit_days(self, app_id: str, kind: str, event_name: Optional[str], days: List[date]):
+        """Publish staged days; days without rows are stored empty"""
+        for day in days:
+            path = self._partition_path(app_id, kind, event_name, day)
+            if os.path.exists(path + _STAGED_SUFFIX):
+                os.replace(path + _STAGED_SUFFIX, path)
+            else:
+                self.write_partition(app_id, kind, event_name, day,
+                                     np.array([], dtype='datetime64[s]'), np.array([], dtype=str))
+
+    def _discard_staged(self, app_id: str, kind: str, event_name: Optional[str], days: List[date]):
+        for day in days:
+            try:
+                os.remove(self._partition_path(app_id, kind, event_name, day) + _STAGED_SUFFIX)
+            except OSError:
+                pass
+
+    async def ingest(self, app_id: str, kind: str, event_name: Optional[str],
+                     date_from: date, date_to: date):
+        """Download rows for a day range from AppsFlyer and store them.
+
+        Rows are bucketed by day while the export streams in. Exports are
+        ordered by time, so once a batch reaches a later day the earlier ones
+        are staged to disk and about one day is kept in memory. Staged days
+        are published when the download has finished; if it fails, or the
+        response has no header, nothing is stored and the days stay missing.
+        """
+        endpoint = f"{APPSFLYER_BASE_URL}/{app_id}/{_ENDPOINTS[kind]}"
+        params = {
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'app_id': app_id
+        }
+        if kind == KIND_EVENTS:
+            params['event_name'] = event_name
+
+        days = _days(date_from, date_to)
+        first_day, last_day = np.datetime64(date_from, 'D'), np.datetime64(date_to, 'D')
+        buckets: Dict[date, List[Tuple[np.ndarray, np.ndarray]]] = {}
+        indexes = None
+        rows = 0
+        try:
+            async for batch in aiter_csv_batches(stream_appsflyer_raw_data(endpoint, params)):
+                if not batch.header:
+                    break
+                if indexes is None:
+                    indexes = (
+                        column_index(batch.header, _TIME_COLUMNS[kind]),
+                        column_index(batch.header, MEDIA_SOURCE_COLUMN)
+                    )
+                times, sources = await run_blocking(self._parse_batch, batch, *indexes)
+                batch_days = times.astype('datetime64[D]')
+                in_range = (batch_days >= first_day) & (batch_days <= last_day)
+                times, sources, batch_days = times[in_range], sources[in_range], batch_days[in_range]
+                if not len(times):
+                    continue
+                rows += len(times)
+                for day in np.unique(batch_days):
+                    mask = batch_days == day
+                    buckets.setdefault(day.astype(date), []).append((times[mask], sources[mask]))
+
+                latest = batch_days.max().astype(date)
+                done = {day: parts for day, parts in buckets.items() if day < latest}
+                if done:
+                    await run_blocking(self._stage_days, app_id, kind, event_name, done)
+                    for day in done:
+                        del buckets[day]
+
+            if indexes is None:
+                logger.warning(f"Empty {kind} export for {app_id} {date_from} - {date_to}, nothing stored")
+                return
+            await run_blocking(self._stage_days, app_id, kind, event_name, buckets)
+            await run_blocking(self._commit_days, app_id, kind, event_name, days)
+        finally:
+            await run_blocking(self._discard_staged, app_id, kind, event_name, days)
+        logger.info(f"Stored {rows} {kind} rows for {app_id} {date_from} - {date_to}")
+
+    async def ensure_range(self, app_id: str, kind: str, event_name: Optional[str],
+                           date_from: date, date_to: date):
+        """Download only the days of the range that are not stored yet"""
+        lock = self._lock(app_id, kind, event_name)
+        async with lock:
+            missing = await run_blocking(
+                self.missing_days, app_id, kind, event_name, _days(date_from, date_to)
+            )
+            for run_from, run_to in _day_runs(missing):
+                await self.ingest(app_id, kind, event_name, run_from, run_to)
+
+    async def sync(self, app_id: str, kind: str, event_name: Optional[str],
+                   through: date, backfill_days: int) -> int:
+        """Download days after the watermark up to through; returns number of days fetched.
+
+        A new stream is backfilled for backfill_days, skipping days already
+        stored by queries. Days after the watermark are always fetched again:
+        they may have been stored before AppsFlyer had all of their data.
+        """
+        if kind == KIND_INSTALLS:
+            event_name = None
+        lock = self._lock(app_id, kind, event_name)
+        async with lock:
+            watermark = await get_sync_watermark(app_id, kind, event_name)
+            if watermark is None:
+                days = await run_blocking(
+                    self.missing_days, app_id, kind, event_name,
+                    _days(through - timedelta(days=backfill_days - 1), through)
+                )
+            else:
+                synced = datetime.strptime(watermark, "%Y-%m-%d").date()
+                days = _days(synced + timedelta(days=1), through)
+            for run_from, run_to in _day_runs(days):
+                await self.ingest(app_id, kind, event_name, run_from, run_to)
+            if watermark is None or days:
+                await set_sync_watermark(app_id, kind, event_name, through.isoformat())
+            return len(days)
+
+    async def daily_counts(self, app_id: str, kind: str, event_name: Optional[str],
+                           date_from: str, date_to: str,
+                           media_source: Optional[str] = None) -> Dict[str, int]:
+        """Get row counts per day for date range, fetching missing days first"""
+        start = datetime.strptime(date_from, "%Y-%m-%d").date()
+        end = min(
+            datetime.strptime(date_to, "%Y-%m-%d").date(),
+            datetime.now(MOSCOW_TZ).date()
+        )
+        if kind == KIND_INSTALLS:
+            event_name = None
+        if start > end:
+            return {}
+
+        await self.ensure_range(app_id, kind, event_name, start, end)
+
+        def count_days():
+            counts = {}
+            for day in _days(start, end):
+                rows = len(self.read_partition(app_id, kind, event_name, day, media_source))
+                if rows:
+                    counts[day.isoformat()] = rows
+            return counts
+
+        return await run_blocking(count_days)
+
+    async def count(self, app_id: str, kind: str, event_name: Optional[str],
+                    date_from: str, date_to: str, media_source: Optional[str] = None) -> int:
+        """Get total row count for date range"""
+        counts = await self.daily_counts(app_id, kind, event_name, date_from, date_to, media_source)
+        return sum(counts.values())
+
+event_store = EventStore(EVENT_STORE_DIR)
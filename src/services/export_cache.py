@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from config.config import (
+    EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES,
+    EXPORT_CACHE_CLOSED_TTL, EXPORT_CACHE_OPEN_TTL, logger
+)
+
+# AppsFlyer exports are requested in Moscow time, so "today" is Moscow today
+MOSCOW_TZ = timezone(timedelta(hours=3))
+
+def normalize_params(params: dict) -> dict:
+    """Drop empty filters and stringify values so equal requests compare equal"""
+    return {
+        str(key): str(value).strip()
+        for key, value in sorted(params.items())
+        if value is not None and str(value).strip() != ''
+    }
+
+def make_cache_key(endpoint: str, params: dict) -> str:
+    """Build content address for export request"""
+    payload = json.dumps(
+        {'endpoint': endpoint, 'params': normalize_params(params)},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def is_closed_range(params: dict) -> bool:
+    """Check if requested date range lies fully in the past"""
+    to_date = str(params.get('to') or '')[:10]
+    try:
+        to_day = datetime.strptime(to_date, "%Y-%m-%d").date()
+    except ValueError:
+        return False
+    return to_day < datetime.now(MOSCOW_TZ).date()
+
+class ExportCache:
+    """Size-bounded LRU cache of raw export bodies stored on disk"""
+
+    def __init__(self, directory: str, max_bytes: int, closed_ttl: int, open_ttl: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.closed_ttl = closed_ttl
+        self.open_ttl = open_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # key -> (size, expires_at), least recently used first
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+
+    def _data_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.csv")
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild index from files left by previous runs"""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                # Interrupted download from previous run
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if not name.endswith('.json'):
+                continue
+            key = name[:-5]
+            try:
+                with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                last_used = os.path.getmtime(self._data_path(key))
+            except (OSError, ValueError):
+                self._remove_files(key)
+                continue
+            entries.append((last_used, key, meta['size'], meta['expires_at']))
+
+        for _, key, size, expires_at in sorted(entries):
+            self._index[key] = (size, expires_at)
+            self._total_bytes += size
+        self._loaded = True
+        logger.info(f"Export cache loaded: {len(self._index)} entries, {self._total_bytes} bytes")
+
+    def _remove_files(self, key: str):
+        for path in (self._data_path(key), self._meta_path(key)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _drop(self, key: str):
+        size, _ = self._index.pop(key)
+        self._total_bytes -= size
+        self._remove_files(key)
+
+    def _evict(self):
+        """Remove least recently used entries until cache fits its budget"""
+        while self._index and self._total_bytes > self.max_bytes:
+            key = next(iter(self._index))
+            self._drop(key)
+            self.evictions += 1
+
+    def get_path(self, key: str) -> Optional[str]:
+        """Get path of cached export body or None, marking entry as recently used"""
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            path = self._data_path(key)
+            if entry[1] < time.time() or not os.path.exists(path):
+                self._drop(key)
+                self.misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            os.utime(path)
+            self.hits += 1
+            return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Get cached export body or None"""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def temp_path(self, key: str) -> str:
+        """Get unique path to stream a new export body into before commit"""
+        os.makedirs(self.directory, exist_ok=True)
+        return self._data_path(key) + f".{threading.get_ident()}.{time.monotonic_ns()}.tmp"
+
+    def commit_file(self, key: str, tmp_path: str, params: dict):
+        """Move fully downloaded export into cache with TTL depending on the requested range"""
+        ttl = self.closed_ttl if is_closed_range(params) else self.open_ttl
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        expires_at = time.time() + ttl
+
+        with self._lock:
+            if not self._loaded:
+                self._load_index()
+            if key in self._index:
+                self._drop(key)
+
+            os.replace(tmp_path, self._data_path(key))
+            with open(self._meta_path(key), 'w', encoding='utf-8') as f:
+                json.dump({'size': size, 'expires_at': expires_at}, f)
+
+            self._index[key] = (size, expires_at)
+            self._total_bytes += size
+            self._evict()
+
+    def put(self, key: str, data: bytes, params: dict):
+        """Store export body"""
+        tmp_path = self.temp_path(key)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        self.commit_file(key, tmp_path, params)
+
+    def stats(self) -> dict:
+        """Get cache counters"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._index),
+                'bytes': self._total_bytes
+            }
+
+export_cache = ExportCache(
+    EXPORT_CACHE_DIR, EXPORT_CACHE_MAX_BYTES,
+    EXPORT_CACHE_CLOSED_TTL, EXPORT_CACHE_OPEN_TTL
+)
@@ -0,0 +1,75 @@
+import time
+from bisect import bisect_left
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config.config import OFFER_CATALOG_TTL, OFFER_PAGE_SIZE, logger
+from database.repository import get_offer_index
+
+class OfferSummary(NamedTuple):
+    """Offer fields needed by lists and pickers"""
+    id: int
+    name: str
+    payout: float
+    appsflyer_offer_id: Optional[str]
+    event_name: Optional[str]
+
+class OfferPage(NamedTuple):
+    """Page of offers with cursors of neighbouring pages (None at the ends)"""
+    offers: List[OfferSummary]
+    prev_cursor: Optional[int]
+    next_cursor: Optional[int]
+
+class OfferCatalog:
+    """In-memory index of offers ordered by id, reloaded after writes"""
+
+    def __init__(self):
+        self._offers: Dict[int, OfferSummary] = {}
+        self._ids: List[int] = []
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._version = 0
+
+    async def _load(self):
+        version = self._version
+        self._offers = {row[0]: OfferSummary(*row) for row in await get_offer_index()}
+        self._ids = sorted(self._offers)
+        self._loaded_at = time.monotonic()
+        # Offer written while the query ran: load again on next access
+        self._loaded = self._version == version
+        logger.info(f"Offer catalog loaded: {len(self._ids)} offers")
+
+    def invalidate(self):
+        """Mark index stale after offer was added, edited or deleted"""
+        self._version += 1
+        self._loaded = False
+
+    async def _ensure_loaded(self):
+        # Offers written by other replicas show up after OFFER_CATALOG_TTL
+        expired = OFFER_CATALOG_TTL is not None and time.monotonic() - self._loaded_at >= OFFER_CATALOG_TTL
+        if not self._loaded or expired:
+            await self._load()
+
+    async def get(self, offer_id: int) -> Optional[OfferSummary]:
+        await self._ensure_loaded()
+        return self._offers.get(offer_id)
+
+    async def page(self, cursor: Optional[int] = None, size: int = OFFER_PAGE_SIZE) -> OfferPage:
+        """Get offers starting at id cursor; cursors stay valid when offers are deleted"""
+        await self._ensure_loaded()
+        start = bisect_left(self._ids, cursor) if cursor is not None else 0
+        ids = self._ids[start:start + size]
+        prev_cursor = self._ids[max(start - size, 0)] if start > 0 else None
+        next_cursor = self._ids[start + size] if start + size < len(self._ids) else None
+        return OfferPage([self._offers[offer_id] for offer_id in ids], prev_cursor, next_cursor)
+
+def parse_page_cursor(data: str, prefix: str) -> Tuple[bool, Optional[int]]:
+    """Check if callback data is a page switch '<prefix>_page_<id>'; returns (is_page, cursor)"""
+    marker = f"{prefix}_page_"
+    if not data.startswith(marker):
+        return False, None
+    try:
+        return True, int(data[len(marker):])
+    except ValueError:
+        return True, None
+
+offer_catalog = OfferCatalog()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from config.config import (
+    APPSFLYER_RATE, APPSFLYER_BURST, APPSFLYER_MIN_RATE,
+    APPSFLYER_QUOTA_BACKOFF, logger
+)
+
+class TokenBucket:
+    """Async token bucket whose rate shrinks on quota errors and recovers on success"""
+
+    def __init__(self, rate: float, capacity: int, min_rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        # Nothing accrues during a pause: after a 429 the bucket restarts empty
+        start = max(self._updated, self._blocked_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        # Lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def penalize(self, retry_after: Optional[float]):
+        """Quota exceeded: pause all requests and halve the rate"""
+        delay = retry_after if retry_after is not None else APPSFLYER_QUOTA_BACKOFF
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = 0
+        logger.warning(f"AppsFlyer quota exceeded, pausing {delay:.0f}s, rate {self.rate:.3f}/s")
+
+    def reward(self):
+        """Successful request: grow rate back towards configured maximum"""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+# One bucket per app and report endpoint
+_buckets: Dict[str, TokenBucket] = {}
+
+def get_bucket(endpoint: str) -> TokenBucket:
+    """Get rate limiter of endpoint; URL path holds app id and report type"""
+    key = urlsplit(endpoint).path
+    if key not in _buckets:
+        _buckets[key] = TokenBucket(APPSFLYER_RATE, APPSFLYER_BURST, APPSFLYER_MIN_RATE)
+    return _buckets[key]
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse Retry-After header given in seconds"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
\ No newline at end of file
@@ -0,0 +1,296 @@
+import asyncio
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional
+
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import ExtBot
+
+from config.config import (
+    APPSFLYER_BASE_URL, logger,
+    REPORT_WORKERS, REPORT_PER_USER_RUNNING, REPORT_PER_USER_QUEUED, REPORT_PROGRESS_INTERVAL,
+    REPORT_JOB_RETENTION_DAYS, REPORT_COMPRESS_ABOVE, TELEGRAM_UPLOAD_LIMIT
+)
+from database.database import REPORT_JOB_COLUMNS
+from database.repository import (
+    save_report_job, set_report_job_status, get_unfinished_report_jobs, delete_finished_report_jobs
+)
+from services.appsflyer_service import spool_appsflyer_raw_data, spool_post_attribution_report
+from services.circuit_breaker import CircuitOpenError
+from utils.replicas import is_local
+from utils.telegram_rate_limiter import PRIORITY_PROGRESS
+
+class ReportJob:
+    """Report requested by user: what to export and where to deliver it"""
+
+    def __init__(self, user_id: int, chat_id: int, message_id: int, report_type: str,
+                 offer_id: int, offer_name: str, app_id: str, event_name: Optional[str],
+                 date_from: str, date_to: str, additional_fields: Optional[str] = None,
+                 job_id: Optional[str] = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.report_type = report_type
+        self.offer_id = offer_id
+        self.offer_name = offer_name
+        self.app_id = app_id
+        self.event_name = event_name
+        self.date_from = date_from
+        self.date_to = date_to
+        self.additional_fields = additional_fields
+        # Progress of running download
+        self.bytes = 0
+        self.rows = 0
+
+    def params(self) -> dict:
+        params = {
+            'from': self.date_from,
+            'to': self.date_to,
+            'app_id': self.app_id
+        }
+        if self.report_type == 'events':
+            params['event_name'] = self.event_name
+        return params
+
+    def record(self) -> dict:
+        """Fields stored in report_jobs table"""
+        return {column: getattr(self, column) for column in REPORT_JOB_COLUMNS}
+
+    @classmethod
+    def from_record(cls, row: tuple) -> 'ReportJob':
+        return cls(*row)
+
+    def set_progress(self, size: int, rows: int):
+        self.bytes = size
+        self.rows = rows
+
+class QueueFull(Exception):
+    """User already has too many queued reports"""
+
+def _format_size(size: int) -> str:
+    if size < 1024 * 1024:
+        return f"{size / 1024:.0f} KB"
+    return f"{size / 1024 / 1024:.1f} MB"
+
+async def _download(job: ReportJob):
+    """Download export of job into temporary file, gzipped when it is big"""
+    params = job.params()
+    logger.info(f"Report job {job.job_id}: {job.report_type} {params}")
+    if job.report_type == 'events':
+        endpoint = f"{APPSFLYER_BASE_URL}/{job.app_id}/in_app_events_report/v5"
+        return await spool_appsflyer_raw_data(endpoint, params, job.set_progress, REPORT_COMPRESS_ABOVE)
+    if job.report_type == 'installs':
+        endpoint = f"{APPSFLYER_BASE_URL}/{job.app_id}/installs_report/v5"
+        return await spool_appsflyer_raw_data(endpoint, params, job.set_progress, REPORT_COMPRESS_ABOVE)
+    if job.report_type == 'post_attribution':
+        return await spool_post_attribution_report(params, job.set_progress, REPORT_COMPRESS_ABOVE)
+    raise ValueError(f"Unknown report type: {job.report_type}")
+
+class ReportQueue:
+    """Queue of report jobs served by a fixed pool of background workers.
+
+    Users take turns: workers pick the next user in round-robin order who
+    has queued jobs and fewer than per_user_running reports in progress.
+    Jobs are recorded in the database and unfinished ones are resumed on
+    start; shards downloaded before a restart are served by the export cache.
+    """
+
+    def __init__(self, workers: int, per_user_running: int, per_user_queued: int):
+        self.workers = workers
+        self.per_user_running = per_user_running
+        self.per_user_queued = per_user_queued
+        self._queues: Dict[int, Deque[ReportJob]] = {}
+        self._turns: Deque[int] = deque()
+        self._running: Dict[int, int] = {}
+        self._changed: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[ExtBot] = None
+
+    async def start(self, bot: ExtBot):
+        """Resume unfinished jobs of previous run and start background workers"""
+        self._bot = bot
+        self._changed = asyncio.Condition()
+        await delete_finished_report_jobs(datetime.now() - timedelta(days=REPORT_JOB_RETENTION_DAYS))
+
+        # Jobs of users served by other replicas are resumed there
+        unfinished = [
+            job for job in map(ReportJob.from_record, await get_unfinished_report_jobs())
+            if is_local(job.user_id)
+        ]
+
+        self._tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Report queue started with {self.workers} workers")
+        if unfinished:
+            # Notices go out in background: a gone chat or slow network must not delay startup
+            self._tasks.append(asyncio.ensure_future(self._resume(unfinished)))
+
+    async def _resume(self, jobs: List[ReportJob]):
+        """Tell users their reports resume and queue them again"""
+        for job in jobs:
+            # Before queueing, so the notice never overwrites progress of a started job
+            await self._edit(job, "🔄 Bot restarted, resuming report...")
+            await self._enqueue(job)
+        logger.info(f"Resumed {len(jobs)} report jobs")
+
+    async def stop(self):
+        """Cancel workers; their jobs stay unfinished in the database and resume on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queued(self, user_id: int) -> int:
+        return len(self._queues.get(user_id, ()))
+
+    def turns_ahead(self, user_id: int) -> int:
+        """Jobs that round-robin turns start before a new job of user would.
+
+        The user's own queued jobs go first; every other user gets at most
+        one turn more than that, so one heavy user does not push a new one
+        far back.
+        """
+        own = self.queued(user_id)
+        return own + sum(
+            min(len(queue), own + 1) for other, queue in self._queues.items() if other != user_id
+        )
+
+    async def submit(self, job: ReportJob):
+        """Queue job; raises QueueFull when the user has too many queued"""
+        if self.queued(job.user_id) >= self.per_user_queued:
+            raise QueueFull()
+        await save_report_job(job.record(), 'queued')
+        await self._enqueue(job)
+
+    async def _enqueue(self, job: ReportJob):
+        async with self._changed:
+            self._queues.setdefault(job.user_id, deque()).append(job)
+            if job.user_id not in self._turns:
+                self._turns.append(job.user_id)
+            self._changed.notify()
+
+    def _pick(self) -> Optional[ReportJob]:
+        """Take next job in round-robin order of users"""
+        for _ in range(len(self._turns)):
+            user_id = self._turns[0]
+            self._turns.rotate(-1)
+            if self._running.get(user_id, 0) >= self.per_user_running:
+                continue
+            queue = self._queues[user_id]
+            job = queue.popleft()
+            if not queue:
+                del self._queues[user_id]
+                self._turns.remove(user_id)
+            self._running[user_id] = self._running.get(user_id, 0) + 1
+            return job
+        return None
+
+    async def _next_job(self) -> ReportJob:
+        async with self._changed:
+            job = None
+            while job is None:
+                job = self._pick()
+                if job is None:
+                    await self._changed.wait()
+            return job
+
+    async def _finished(self, job: ReportJob):
+        async with self._changed:
+            self._running[job.user_id] -= 1
+            if not self._running[job.user_id]:
+                del self._running[job.user_id]
+            # User may have jobs waiting for this slot
+            self._changed.notify_all()
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._next_job()
+            try:
+                await set_report_job_status(job.job_id, 'running')
+                status = await self._run(job)
+                await set_report_job_status(job.job_id, status)
+            except asyncio.CancelledError:
+                raise
+            except CircuitOpenError as e:
+                logger.warning(f"Report job {job.job_id} rejected: {str(e)}")
+                await self._edit(job, "⚠️ AppsFlyer is temporarily unavailable. Try again later.")
+                await set_report_job_status(job.job_id, 'failed', str(e))
+            except Exception as e:
+                logger.error(f"Report job {job.job_id} failed: {str(e)}")
+                await self._edit(job, "❌ Error generating report")
+                await set_report_job_status(job.job_id, 'failed', str(e))
+            finally:
+                await self._finished(job)
+
+    async def _edit(self, job: ReportJob, text: str):
+        """Update progress message of job; failures (message gone, bot blocked, network) are only logged"""
+        try:
+            # Progress edits yield to interactive replies; queued ones are coalesced
+            await self._bot.edit_message_text(
+                text, chat_id=job.chat_id, message_id=job.message_id, rate_limit_args=PRIORITY_PROGRESS
+            )
+        except BadRequest as e:
+            # Usually 'message is not modified'
+            logger.debug(f"Progress message of job {job.job_id} not updated: {e}")
+        except TelegramError as e:
+            logger.warning(f"Progress message of job {job.job_id} not updated: {e}")
+
+    async def _run(self, job: ReportJob) -> str:
+        """Download report, reporting progress, and send it as document; returns final status"""
+        await self._edit(job, "⏳ Generating report...")
+        download = asyncio.ensure_future(_download(job))
+        try:
+            while not download.done():
+                done, _ = await asyncio.wait({download}, timeout=REPORT_PROGRESS_INTERVAL)
+                if not done:
+                    await self._edit(
+                        job,
+                        f"⏳ Downloading report: {_format_size(job.bytes)}, {job.rows} rows"
+                    )
+        finally:
+            if not download.done():
+                download.cancel()
+        export = download.result()
+
+        if not export.size:
+            logger.warning(f"No data received for report type: {job.report_type}")
+            if export.file:
+                export.file.close()
+            await self._edit(job, f"⚠️ No data for period {job.date_from} - {job.date_to}")
+            return 'empty'
+
+        with export.file as csv_file:
+            csv_file.seek(0, 2)
+            upload_size = csv_file.tell()
+            csv_file.seek(0)
+            logger.info(f"Report job {job.job_id}: received {export.size} bytes, uploading {upload_size}")
+            if upload_size > TELEGRAM_UPLOAD_LIMIT:
+                await self._edit(
+                    job,
+                    f"⚠️ Report is too big for Telegram ({_format_size(upload_size)} compressed). "
+                    "Choose a shorter period."
+                )
+                return 'too_big'
+
+            filename = f"{job.report_type}_{job.date_from}_to_{job.date_to}.csv"
+            caption = f"📊 Report for: {job.offer_name}\nType: {job.report_type}"
+            if export.compressed:
+                filename += '.gz'
+                caption += f"\nCompressed: {_format_size(export.size)} → {_format_size(upload_size)}"
+
+            await self._edit(job, f"📤 Uploading report: {_format_size(upload_size)}, {job.rows} rows")
+            await self._bot.send_document(
+                chat_id=job.chat_id,
+                document=csv_file,
+                filename=filename,
+                caption=caption
+            )
+        try:
+            await self._bot.delete_message(chat_id=job.chat_id, message_id=job.message_id)
+        except TelegramError as e:
+            # Report is delivered; a leftover status message is harmless
+            logger.warning(f"Status message of job {job.job_id} not deleted: {e}")
+        return 'done'
+
+report_queue = ReportQueue(REPORT_WORKERS, REPORT_PER_USER_RUNNING, REPORT_PER_USER_QUEUED)
\ No newline at end of file
@@ -0,0 +1,7 @@
+import asyncio
+from functools import partial
+
+async def run_blocking(func, *args, **kwargs):
+    """Run blocking call (disk I/O, parsing) in default executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
@@ -0,0 +1,133 @@
+import csv
+import io
+from typing import AsyncIterator, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from config.config import CSV_BATCH_BYTES
+
+_NEWLINE = ord('\n')
+_QUOTE = ord('"')
+
+class CsvBatch(NamedTuple):
+    """Block of complete UTF-8 CSV records sharing the export header"""
+    header: List[str]
+    data: bytes
+    rows: int
+
+def _outside_quotes(positions: np.ndarray, quotes: np.ndarray) -> np.ndarray:
+    """Keep delimiter positions preceded by an even number of quotes"""
+    # Escaped quote ("") adds two and keeps parity
+    return positions[(np.searchsorted(quotes, positions) & 1) == 0]
+
+def _record_ends(data: bytes) -> np.ndarray:
+    """Get end offsets of complete records in data starting at a record boundary"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(buffer == _NEWLINE)
+    if _QUOTE in data:
+        newlines = _outside_quotes(newlines, np.flatnonzero(buffer == _QUOTE))
+    return newlines + 1
+
+class IncrementalCsvSplitter:
+    """Split UTF-8 byte stream into complete CSV records.
+
+    Quoted fields may contain commas and newlines, so a record ends only
+    on a newline outside of quotes. All delimiters are ASCII, so records
+    are cut on raw bytes without decoding. The header is parsed separately.
+    """
+
+    def __init__(self):
+        self._pending = b''
+        self.header: Optional[List[str]] = None
+
+    @staticmethod
+    def _split_complete(data: bytes):
+        """Find end of last complete record in data; returns (end, records)"""
+        # Fast path: unquoted data, records end on every newline
+        if b'"' not in data:
+            end = data.rfind(b'\n') + 1
+            return end, data.count(b'\n', 0, end)
+
+        ends = _record_ends(data)
+        if not len(ends):
+            return 0, 0
+        return int(ends[-1]), len(ends)
+
+    def feed(self, chunk: bytes, final: bool = False):
+        """Feed raw bytes; returns (data, rows) of complete records"""
+        data = self._pending + chunk
+        if self.header is None and data.startswith(b'\xef\xbb\xbf'):
+            data = data[3:]
+
+        # Pending data always starts at a record boundary
+        end, records = self._split_complete(data)
+        if final and data[end:].strip():
+            end, records = len(data), records + 1
+
+        complete, self._pending = data[:end], data[end:]
+        if self.header is None and complete:
+            ends = _record_ends(complete)
+            header_end = int(ends[0]) if len(ends) else len(complete)
+            header_text = complete[:header_end].decode('utf-8', errors='replace')
+            self.header = next(csv.reader([header_text]), [])
+            complete = complete[header_end:]
+            records -= 1
+        return complete, records
+
+async def aiter_csv_batches(chunks: AsyncIterator[bytes],
+                            batch_bytes: int = CSV_BATCH_BYTES) -> AsyncIterator[CsvBatch]:
+    """Turn stream of byte chunks into batches of complete CSV records"""
+    splitter = IncrementalCsvSplitter()
+    parts: List[bytes] = []
+    size = 0
+    rows = 0
+
+    async for chunk in chunks:
+        data, records = splitter.feed(chunk)
+        if not data:
+            continue
+        parts.append(data)
+        size += len(data)
+        rows += records
+        if size >= batch_bytes:
+            yield CsvBatch(splitter.header, b''.join(parts), rows)
+            parts, size, rows = [], 0, 0
+
+    data, records = splitter.feed(b'', final=True)
+    if data:
+        parts.append(data)
+        rows += records
+    if parts or splitter.header is not None:
+        yield CsvBatch(splitter.header or [], b''.join(parts), rows)
+
+def column_index(header: List[str], column: str) -> int:
+    """Find column position by header name"""
+    normalized = [name.strip().lower() for name in header]
+    try:
+        return normalized.index(column.strip().lower())
+    except ValueError:
+        raise ValueError(f"Column '{column}' not found in export")
+
+def batch_columns(batch: CsvBatch, indexes: List[int]) -> List[np.ndarray]:
+    """Extract columns of batch as string arrays with the pandas C parser"""
+    if not batch.data:
+        return [np.array([], dtype=str) for _ in indexes]
+
+    # Malformed (ragged) records are skipped instead of failing the batch
+    frame = pd.read_csv(
+        io.BytesIO(batch.data),
+        header=None,
+        usecols=indexes,
+        dtype=str,
+        encoding='utf-8',
+        encoding_errors='replace',
+        keep_default_na=False,
+        on_bad_lines='skip'
+    )
+    return [frame[index].to_numpy(dtype=str) for index in indexes]
+
+def parse_timestamps(values: np.ndarray) -> np.ndarray:
+    """Parse 'YYYY-MM-DD HH:MM:SS' timestamp strings in bulk; unparsable values become NaT"""
+    times = pd.to_datetime(values, format='ISO8601', errors='coerce')
+    return np.asarray(times, dtype='datetime64[s]')
\ No newline at end of file
@@ -0,0 +1,22 @@
+from typing import Callable, List
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from services.offer_catalog import OfferPage, OfferSummary
+
+def offer_page_keyboard(page: OfferPage, prefix: str,
+                        offer_row: Callable[[OfferSummary], List[InlineKeyboardButton]],
+                        extra_rows: List[List[InlineKeyboardButton]] = None) -> InlineKeyboardMarkup:
+    """Build keyboard for page of offers with ◀️/▶️ buttons to neighbouring pages"""
+    keyboard = [offer_row(offer) for offer in page.offers]
+
+    navigation = []
+    if page.prev_cursor is not None:
+        navigation.append(InlineKeyboardButton("◀️ Prev", callback_data=f"{prefix}_page_{page.prev_cursor}"))
+    if page.next_cursor is not None:
+        navigation.append(InlineKeyboardButton("Next ▶️", callback_data=f"{prefix}_page_{page.next_cursor}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    keyboard.extend(extra_rows or [])
+    return InlineKeyboardMarkup(keyboard)
\ No newline at end of file
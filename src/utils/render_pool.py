@@ -0,0 +1,70 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Optional
+
+from config.config import RENDER_POOL_WORKERS, logger
+
+# Charts render in separate processes so plotting never stalls the bot loop
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _init_worker():
+    """Pre-import plotting stack with the non-interactive backend"""
+    from utils.report_utils import _pyplot
+    _pyplot()
+    import pandas  # noqa: F401
+    import sklearn.linear_model  # noqa: F401
+    import sklearn.preprocessing  # noqa: F401
+
+def _warm_up() -> bool:
+    return True
+
+def _render(func, args: tuple, kwargs: dict) -> bytes:
+    """Run render function in worker and return its output as bytes"""
+    return func(*args, **kwargs).getvalue()
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Get render process pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        # spawn: forking a process with a running event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=RENDER_POOL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    return _pool
+
+async def start_render_pool():
+    """Start render workers so the first chart does not pay for imports"""
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    await asyncio.gather(*[
+        loop.run_in_executor(pool, _warm_up) for _ in range(RENDER_POOL_WORKERS)
+    ])
+    logger.info(f"Render pool started with {RENDER_POOL_WORKERS} workers")
+
+def shutdown_render_pool(wait: bool = True):
+    """Stop render workers; wait=False returns at once and lets them exit in background"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+async def render(func, *args, **kwargs) -> BytesIO:
+    """Render chart or PDF in worker process; func must be a module-level function returning BytesIO"""
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    try:
+        data = await loop.run_in_executor(pool, _render, func, args, kwargs)
+    except BrokenProcessPool:
+        # Worker crashed: replace the pool and retry once. Not waiting for
+        # the dead pool keeps the event loop free; concurrent renders that
+        # failed on it reuse the replacement instead of shutting it down
+        if _pool is pool:
+            logger.warning("Render pool is broken, restarting it")
+            shutdown_render_pool(wait=False)
+        data = await loop.run_in_executor(get_render_pool(), _render, func, args, kwargs)
+    return BytesIO(data)
\ No newline at end of file
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from telegram import Update
+
+from config.config import WEBHOOK_REPLICAS, WEBHOOK_REPLICA_INDEX
+
+def replica_count() -> int:
+    return max(len(WEBHOOK_REPLICAS), 1)
+
+def is_primary() -> bool:
+    """Replica that runs shared background work (nightly sync) for all of them"""
+    return WEBHOOK_REPLICA_INDEX == 0
+
+def owner_of(user_or_chat_id: int) -> int:
+    """Index of the replica that serves a user (or a chat without user)"""
+    return user_or_chat_id % replica_count()
+
+def is_local(user_or_chat_id: int) -> bool:
+    return owner_of(user_or_chat_id) == WEBHOOK_REPLICA_INDEX
+
+def update_owner(update: Update) -> Optional[int]:
+    """Replica index for update, or None if any replica may process it.
+
+    Routing by user keeps every conversation, user_data and report job of
+    one user on one replica, so its in-memory state is the current one.
+    """
+    if replica_count() == 1:
+        return None
+    if update.effective_user is not None:
+        return owner_of(update.effective_user.id)
+    if update.effective_chat is not None:
+        return owner_of(update.effective_chat.id)
+    return None
\ No newline at end of file
@@ -1,15 +1,21 @@
 from io import BytesIO
-from reportlab.pdfgen import canvas
-import matplotlib.pyplot as plt
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import PolynomialFeatures
-import pandas as pd
 from datetime import datetime
-from collections import defaultdict
+
+# Plotting, ML and PDF libraries take seconds to import, so they are
+# imported by the functions that use them: importing this module is cheap.
+# Charts are rendered in worker processes that pre-import them on start.
+
+def _pyplot():
+    """Import pyplot with the non-interactive backend"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 def generate_report(data: dict) -> BytesIO:
     """Generate PDF report from data"""
+    from reportlab.pdfgen import canvas
+
     buffer = BytesIO()
     p = canvas.Canvas(buffer)
 
@@ -55,14 +61,11 @@ def generate_report(data: dict) -> BytesIO:
     buffer.seek(0)
     return buffer
 
-def generate_conversion_analysis(installs_data: str, events_data: str, offer_name: str, date_range: tuple) -> BytesIO:
+def generate_conversion_analysis(installs_count: int, events_count: int, offer_name: str, date_range: tuple) -> BytesIO:
     """Generate conversion analysis graph"""
+    plt = _pyplot()
     from_date, to_date = date_range
     
-    # Parse CSV data
-    installs_count = len(installs_data.splitlines()) - 1
-    events_count = len(events_data.splitlines()) - 1
-    
     conversion_rate = (events_count / installs_count) * 100 if installs_count else 0
     
     plt.figure(figsize=(8, 4))
@@ -78,33 +81,22 @@ def generate_conversion_analysis(installs_data: str, events_data: str, offer_nam
     
     return buf
 
-def generate_revenue_forecast(events_data: str, payout: float, date_range: tuple) -> BytesIO:
-    """Generate revenue forecast graph"""
+def generate_revenue_forecast(date_events: dict, payout: float, date_range: tuple) -> BytesIO:
+    """Generate revenue forecast graph from daily event counts"""
+    import numpy as np
+    import pandas as pd
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import PolynomialFeatures
+
+    plt = _pyplot()
     from_date, to_date = date_range
-    
-    # Parse events by date
-    date_events = defaultdict(int)
-    for line in events_data.splitlines()[1:]:
-        parts = line.split(',')
-        if len(parts) >= 4:
-            event_time = parts[3].strip()
-            try:
-                date_str = event_time.split(' ')[0]
-                date_events[date_str] += 1
-            except (IndexError, AttributeError):
-                continue
-
-    # Create time series
+
+    # Create time series: missing days have zero events
     date_range = pd.date_range(start=from_date, end=to_date)
-    df = pd.DataFrame(index=date_range, columns=['events'], data=0)
-    
-    for date_str, count in date_events.items():
-        try:
-            date = pd.to_datetime(date_str)
-            if date in df.index:
-                df.loc[date, 'events'] = count
-        except pd.errors.ParserError:
-            continue
+    events = pd.Series(date_events, dtype='int64')
+    events.index = pd.to_datetime(events.index, errors='coerce')
+    events = events[events.index.notna()].groupby(level=0).sum()
+    df = events.reindex(date_range, fill_value=0).to_frame('events')
 
     df['revenue'] = df['events'] * payout
 
@@ -148,24 +140,20 @@ def generate_revenue_forecast(events_data: str, payout: float, date_range: tuple
 
     return buf
 
-def generate_trend_analysis(installs_data: str, date_range: tuple, offer_name: str) -> BytesIO:
-    """Generate trend analysis graph"""
+def generate_trend_analysis(date_counts: dict, date_range: tuple, offer_name: str) -> BytesIO:
+    """Generate trend analysis graph from daily install counts"""
+    import pandas as pd
+
+    plt = _pyplot()
     from_date, to_date = date_range
-    
-    # Parse data
-    date_counts = {}
-    for line in installs_data.splitlines()[1:]:
-        parts = line.split(',')
-        if len(parts) >= 2:
-            date_str = parts[1].split(' ')[0]
-            date_counts[date_str] = date_counts.get(date_str, 0) + 1
 
     if not date_counts:
         raise ValueError("Insufficient data for trend analysis")
 
     # Sort dates
-    parsed_dates = sorted(date_counts.keys())
-    installs = [date_counts[date] for date in parsed_dates]
+    counts = pd.Series(date_counts, dtype='int64').sort_index()
+    parsed_dates = counts.index.tolist()
+    installs = counts.to_numpy()
 
     # Plot
     plt.figure(figsize=(12, 6))
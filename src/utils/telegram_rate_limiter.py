@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config.config import logger
+
+# Request priorities, lower is sent first; pass as rate_limit_args to override
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PROGRESS = 1
+PRIORITY_BULK = 2
+
+_BULK_ENDPOINTS = {'sendDocument', 'sendMediaGroup', 'sendVideo', 'sendAudio'}
+# Only the latest of several queued edits of one message is sent
+_COALESCED_ENDPOINTS = {'editMessageText'}
+# Private chats are paced only for new messages; edits and actions go out at once
+_UNPACED_SEND_ENDPOINTS = {'sendChatAction'}
+
+def _is_group(chat_id) -> bool:
+    """Negative ids and @usernames are groups and channels"""
+    if isinstance(chat_id, str):
+        return chat_id.startswith(('@', '-'))
+    return isinstance(chat_id, int) and chat_id < 0
+
+class _Request:
+    def __init__(self, callback: Callable, args: Any, kwargs: Dict[str, Any], endpoint: str,
+                 chat_id: Any, priority: int, seq: int, edit_key: Optional[tuple]):
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.endpoint = endpoint
+        self.chat_id = chat_id
+        self.priority = priority
+        self.seq = seq
+        self.edit_key = edit_key
+        self.retries = 0
+        # Callers of coalesced edits share the result of the edit that is sent
+        self.futures: List[asyncio.Future] = []
+
+class PriorityRateLimiter(BaseRateLimiter[int]):
+    """Send Bot API requests within Telegram's global and per-chat limits.
+
+    Requests addressed to a chat wait in one queue. The dispatcher starts the
+    highest-priority request whose chat may receive a message, as soon as
+    the global limit allows, without waiting for earlier ones to finish.
+    Interactive replies go ahead of progress edits and bulk uploads. Groups
+    are paced for every request, private chats only for new messages.
+    On RetryAfter the chat (or everything, for requests without chat) is
+    paused for the requested time and the request is queued again. A
+    request whose callers were all cancelled is dropped from the queue.
+    """
+
+    def __init__(self, overall_rate: float, chat_interval: float, group_interval: float,
+                 max_retries: int):
+        self.overall_rate = overall_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self._queue: List[_Request] = []
+        self._edits: Dict[tuple, _Request] = {}
+        # Earliest time of the next paced request, and RetryAfter pauses, per chat
+        self._chat_ready: Dict[Any, float] = {}
+        self._chat_paused: Dict[Any, float] = {}
+        self._sent: Deque[float] = deque()
+        self._paused_until = 0.0
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks = set()
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for request in self._queue:
+            for future in request.futures:
+                future.cancel()
+        self._queue.clear()
+        self._edits.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # Not a message (getMe, answerCallbackQuery...): only global pause applies
+            delay = self._paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await self._call_direct(callback, args, kwargs)
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(self._on_future_done)
+        edit_key = (chat_id, data.get('message_id')) if endpoint in _COALESCED_ENDPOINTS else None
+        queued = self._edits.get(edit_key) if edit_key is not None else None
+        if queued is not None:
+            # Not sent yet: send the newer text instead
+            queued.args, queued.kwargs = args, kwargs
+            queued.futures.append(future)
+            return await future
+
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        elif endpoint in _BULK_ENDPOINTS:
+            priority = PRIORITY_BULK
+        else:
+            priority = PRIORITY_INTERACTIVE
+        request = _Request(callback, args, kwargs, endpoint, chat_id, priority, next(self._seq), edit_key)
+        request.futures.append(future)
+        self._enqueue(request)
+        return await future
+
+    async def _call_direct(self, callback, args, kwargs):
+        for attempt in itertools.count():
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                self._pause(None, e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    def _on_future_done(self, future: asyncio.Future):
+        if future.cancelled() and self._wakeup is not None:
+            # Let the dispatcher drop the request if nobody waits for it anymore
+            self._wakeup.set()
+
+    def _enqueue(self, request: _Request):
+        if all(future.done() for future in request.futures):
+            return
+        if request.edit_key is not None:
+            queued = self._edits.get(request.edit_key)
+            if queued is not None:
+                # Retried edit is older than the one already waiting
+                queued.futures.extend(request.futures)
+                return
+            self._edits[request.edit_key] = request
+        self._queue.append(request)
+        self._wakeup.set()
+
+    def _interval(self, request: _Request) -> float:
+        """Time the chat must wait after request before its next paced one"""
+        if _is_group(request.chat_id):
+            return self.group_interval
+        if request.endpoint.startswith('send') and request.endpoint not in _UNPACED_SEND_ENDPOINTS:
+            return self.chat_interval
+        return 0.0
+
+    def _ready_at(self, request: _Request) -> float:
+        ready_at = self._chat_paused.get(request.chat_id, 0.0)
+        if self._interval(request):
+            ready_at = max(ready_at, self._chat_ready.get(request.chat_id, 0.0))
+        return ready_at
+
+    def _remove(self, request: _Request):
+        self._queue.remove(request)
+        if self._edits.get(request.edit_key) is request:
+            del self._edits[request.edit_key]
+
+    def _pause(self, chat_id, retry_after: float):
+        until = time.monotonic() + retry_after
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+        else:
+            self._chat_paused[chat_id] = max(self._chat_paused.get(chat_id, 0.0), until)
+        logger.warning(f"Telegram flood control: {'all chats' if chat_id is None else chat_id} "
+                       f"paused for {retry_after}s")
+
+    def _next_ready(self, now: float):
+        """Get best request that may be sent now, or time when one may be"""
+        best = None
+        wake_at = None
+        for request in list(self._queue):
+            if all(future.cancelled() for future in request.futures):
+                self._remove(request)
+                continue
+            ready_at = self._ready_at(request)
+            if ready_at <= now:
+                if best is None or (request.priority, request.seq) < (best.priority, best.seq):
+                    best = request
+            elif wake_at is None or ready_at < wake_at:
+                wake_at = ready_at
+        return best, wake_at
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            # Sliding one-second window for the global limit
+            while self._sent and now - self._sent[0] >= 1:
+                self._sent.popleft()
+            wait = self._paused_until - now
+            if len(self._sent) >= self.overall_rate:
+                wait = max(wait, 1 - (now - self._sent[0]))
+            request, wake_at = (None, None) if wait > 0 else self._next_ready(now)
+            if request is None:
+                if not self._queue:
+                    # Forget chats whose interval or pause has passed
+                    self._chat_ready = {chat: t for chat, t in self._chat_ready.items() if t > now}
+                    self._chat_paused = {chat: t for chat, t in self._chat_paused.items() if t > now}
+                if wait <= 0:
+                    wait = wake_at - now if wake_at is not None else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._remove(request)
+            self._sent.append(now)
+            interval = self._interval(request)
+            if interval:
+                self._chat_ready[request.chat_id] = now + interval
+            task = asyncio.ensure_future(self._send(request))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, request: _Request):
+        try:
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            self._pause(request.chat_id, e.retry_after)
+            if request.retries < self.max_retries:
+                request.retries += 1
+                self._enqueue(request)
+                return
+            self._finish(request, exception=e)
+        except Exception as e:
+            self._finish(request, exception=e)
+        else:
+            self._finish(request, result=result)
+
+    @staticmethod
+    def _finish(request: _Request, result=None, exception: Optional[BaseException] = None):
+        for future in request.futures:
+            if future.done():
+                continue
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
\ No newline at end of file
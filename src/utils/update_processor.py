@@ -0,0 +1,128 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config.config import logger
+
+def _ordering_key(update: object) -> Optional[str]:
+    """Updates with the same key are processed one at a time, in arrival order"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return f"chat:{update.effective_chat.id}"
+    if update.effective_user is not None:
+        return f"user:{update.effective_user.id}"
+    return None
+
+class UpdateQueue(asyncio.Queue):
+    """Application update queue counting updates taken out for processing.
+
+    With concurrent processing the application takes every update off the
+    queue at once and starts a task for it, so queue size alone does not
+    show the backlog.
+    """
+
+    def __init__(self, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.taken = 0
+
+    async def get(self):
+        item = await super().get()
+        self.taken += 1
+        return item
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates of different chats concurrently, updates of one chat in order.
+
+    The chat lock is taken before a concurrency slot, so updates waiting
+    behind a long handler of their own chat do not hold slots other chats
+    could use. The base class limit (max_in_flight) only bounds updates
+    inside do_process_update; updates the application has started tasks
+    for may wait before it. pending() counts all of them and is what
+    admission (webhook 503) checks.
+    """
+
+    def __init__(self, concurrency: int, max_in_flight: int, update_queue: UpdateQueue):
+        super().__init__(max_in_flight)
+        self.concurrency = concurrency
+        self.update_queue = update_queue
+        self._slots = asyncio.BoundedSemaphore(concurrency)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._depths: Dict[str, int] = {}
+        self._running = 0
+        self._processed = 0
+        self._wait_total = 0.0
+        self._max_wait = 0.0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        key = _ordering_key(update)
+        queued_at = time.monotonic()
+        try:
+            if key is None:
+                async with self._slots:
+                    await self._run(coroutine, queued_at)
+            else:
+                await self._run_in_order(key, coroutine, queued_at)
+        finally:
+            self._processed += 1
+
+    async def _run_in_order(self, key: str, coroutine: Awaitable[Any], queued_at: float):
+        self._depths[key] = self._depths.get(key, 0) + 1
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                async with self._slots:
+                    await self._run(coroutine, queued_at)
+        finally:
+            self._depths[key] -= 1
+            if not self._depths[key]:
+                del self._depths[key]
+                del self._locks[key]
+
+    async def _run(self, coroutine: Awaitable[Any], queued_at: float):
+        wait = time.monotonic() - queued_at
+        self._wait_total += wait
+        self._max_wait = max(self._max_wait, wait)
+        self._running += 1
+        try:
+            await coroutine
+        finally:
+            self._running -= 1
+
+    def backlog(self) -> int:
+        """Updates taken off the queue and not finished, running or waiting"""
+        return max(self.update_queue.taken - self._processed, 0)
+
+    def pending(self) -> int:
+        """All admitted updates not finished yet, including those still queued"""
+        return self.update_queue.qsize() + self.backlog()
+
+    def stats(self) -> dict:
+        """Queue depth and wait time metrics"""
+        return {
+            'queued': self.update_queue.qsize(),
+            'running': self._running,
+            'waiting': max(self.backlog() - self._running, 0),
+            'busiest_chat_depth': max(self._depths.values(), default=0),
+            'chats': len(self._depths),
+            'processed': self._processed,
+            'avg_wait': self._wait_total / self._processed if self._processed else 0.0,
+            'max_wait': self._max_wait
+        }
+
+    async def log_stats(self, context=None):
+        """JobQueue callback writing metrics to the log"""
+        stats = self.stats()
+        logger.info(
+            f"Updates: {stats['running']} running, {stats['waiting']} waiting in {stats['chats']} chats, "
+            f"{stats['processed']} processed, wait avg {stats['avg_wait']:.2f}s max {stats['max_wait']:.2f}s"
+        )
\ No newline at end of file
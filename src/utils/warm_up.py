@@ -0,0 +1,30 @@
+import importlib
+import time
+
+from config.config import logger
+from utils.async_utils import run_blocking
+from utils.render_pool import start_render_pool
+
+# Modules of the analytics stack used in the bot process; handlers import
+# them lazily so the bot answers before they are loaded
+LAZY_MODULES = (
+    'numpy',
+    'pandas',
+    'services.event_store',
+)
+
+def import_lazy_modules():
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+
+async def warm_up():
+    """Load analytics stack and start render workers in background after startup"""
+    started = time.perf_counter()
+    try:
+        await run_blocking(import_lazy_modules)
+        await start_render_pool()
+    except Exception as e:
+        # First analysis loads everything itself
+        logger.warning(f"Warm-up failed: {str(e)}")
+        return
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.1f}s")
\ No newline at end of file
@@ -0,0 +1,152 @@
+import asyncio
+import hmac
+import signal
+from typing import Optional
+from urllib.parse import urlsplit
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from telegram import Update
+from telegram.ext import Application
+
+from config.config import (
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_MAX_PENDING, WEBHOOK_REPLICAS, WEBHOOK_REPLICA_INDEX,
+    WEBHOOK_FORWARD_TIMEOUT, logger
+)
+from utils.replicas import update_owner
+from utils.update_processor import PerChatUpdateProcessor
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Set on updates passed on by another replica; they are never forwarded again
+FORWARDED_HEADER = 'X-Bot-Forwarded-By'
+
+class WebhookServer:
+    """HTTP endpoint that receives updates from Telegram and feeds the application.
+
+    When WEBHOOK_MAX_PENDING updates are unfinished (queued, waiting for
+    their chat or running) the update is answered with 503 and Telegram
+    delivers it again later, so a slow bot pushes back instead of buffering
+    without limit.
+
+    With several replicas, an update of a user owned by another replica is
+    forwarded to it and answered with its response, so every user is
+    served by one replica whatever the load balancer picks.
+    """
+
+    def __init__(self, application: Application, path: str, secret: str):
+        self.application = application
+        self.path = path
+        self.secret = secret.encode()
+        self.rejected = 0
+        self.forwarded = 0
+        self.session: Optional[ClientSession] = None
+        self.app = web.Application()
+        self.app.router.add_post(path, self._handle_update)
+        self.app.router.add_get('/healthz', self._handle_health)
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, '').encode()
+        if not hmac.compare_digest(token, self.secret):
+            logger.warning(f"Webhook request from {request.remote} with wrong secret token")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            # Valid JSON but not an update: retrying would not help either
+            return web.Response(status=400)
+
+        try:
+            update = Update.de_json(data, self.application.bot)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            logger.warning(f"Webhook request with malformed update: {str(data)[:200]}")
+            return web.Response(status=400)
+        owner = update_owner(update)
+        if owner is not None and owner != WEBHOOK_REPLICA_INDEX and FORWARDED_HEADER not in request.headers:
+            return await self._forward(owner, data)
+
+        processor = self.application.update_processor
+        try:
+            if isinstance(processor, PerChatUpdateProcessor) and processor.pending() >= WEBHOOK_MAX_PENDING:
+                raise asyncio.QueueFull()
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            logger.warning(f"Update queue is full, rejected update {data.get('update_id')}")
+            return web.Response(status=503, headers={'Retry-After': '1'})
+        return web.Response()
+
+    async def _forward(self, owner: int, data: dict) -> web.Response:
+        """Pass update to the replica that owns its user; its status goes back to Telegram"""
+        headers = {SECRET_HEADER: self.secret.decode(), FORWARDED_HEADER: str(WEBHOOK_REPLICA_INDEX)}
+        try:
+            async with self.session.post(WEBHOOK_REPLICAS[owner] + self.path, json=data, headers=headers) as response:
+                status = response.status
+        except (ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Forwarding update {data.get('update_id')} to replica {owner} failed: {str(e)}")
+            status = 503
+        if status == 200:
+            self.forwarded += 1
+            return web.Response()
+        # Telegram delivers the update again later
+        return web.Response(status=status, headers={'Retry-After': '1'} if status == 503 else None)
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        """Load balancer check with queue depth"""
+        queue = self.application.update_queue
+        health = {
+            'pending': queue.qsize(),
+            'max_pending': queue.maxsize,
+            'rejected': self.rejected,
+            'replica': WEBHOOK_REPLICA_INDEX,
+            'forwarded': self.forwarded
+        }
+        processor = self.application.update_processor
+        if isinstance(processor, PerChatUpdateProcessor):
+            health['updates'] = processor.stats()
+        return web.json_response(health)
+
+async def run_webhook(application: Application):
+    """Serve updates over webhook until SIGINT/SIGTERM, running the same hooks as run_polling"""
+    if not WEBHOOK_URL or not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_URL and WEBHOOK_SECRET must be set in webhook mode")
+    if WEBHOOK_REPLICAS and not 0 <= WEBHOOK_REPLICA_INDEX < len(WEBHOOK_REPLICAS):
+        raise RuntimeError(f"WEBHOOK_REPLICA_INDEX must be below {len(WEBHOOK_REPLICAS)} replicas")
+
+    server = WebhookServer(application, urlsplit(WEBHOOK_URL).path or '/', WEBHOOK_SECRET)
+    runner = web.AppRunner(server.app, access_log=None)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server.session = ClientSession(timeout=ClientTimeout(total=WEBHOOK_FORWARD_TIMEOUT))
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        # Every replica registers the same URL; the webhook is kept on
+        # shutdown because the other replicas still serve it
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, WEBHOOK_LISTEN, WEBHOOK_PORT).start()
+        logger.info(f"Webhook server listening on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}{server.path}")
+        await stop.wait()
+    finally:
+        # Stop accepting updates first, then let the application drain its queue
+        await runner.cleanup()
+        await server.session.close()
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
\ No newline at end of file
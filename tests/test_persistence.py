@@ -0,0 +1,144 @@
+import asyncio
+import os
+import pickle
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from database import persistence as persistence_module  # noqa: E402
+from database.persistence import (  # noqa: E402
+    USER_DATA, KeyValueStore, MemoryKeyValueStore, StorePersistence
+)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class FlakyStore(MemoryKeyValueStore):
+    """Fails the first writes, then behaves like the memory store"""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def write(self, changes):
+        await asyncio.sleep(0.01)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('store unavailable')
+        return await super().write(changes)
+
+def test_changes_of_one_round_are_written_in_one_batch():
+    async def scenario():
+        store = MemoryKeyValueStore()
+        persistence = StorePersistence(store)
+        await persistence.update_user_data(1, {'step': 'date'})
+        await persistence.update_user_data(2, {'step': 'offer'})
+        await persistence.update_conversation('report', (1, 1), 'CHOOSING')
+        await persistence.flush()
+        return store
+
+    store = run(scenario())
+    assert store.writes == 1
+    assert pickle.loads(store.data[(USER_DATA, '1')][0]) == {'step': 'date'}
+    assert pickle.loads(store.data[('conversation:report', '[1, 1]')][0]) == 'CHOOSING'
+
+def test_state_is_restored_by_another_replica():
+    async def scenario():
+        store = MemoryKeyValueStore()
+        first = StorePersistence(store)
+        await first.update_conversation('report', (1, 1), 'CHOOSING')
+        await first.update_user_data(1, {'step': 'date'})
+        await first.flush()
+
+        second = StorePersistence(store)
+        return await second.get_conversations('report'), await second.get_user_data()
+
+    conversations, user_data = run(scenario())
+    assert conversations == {(1, 1): 'CHOOSING'}
+    assert user_data == {1: {'step': 'date'}}
+
+def test_refresh_loads_newer_revision():
+    async def scenario():
+        store = MemoryKeyValueStore()
+        first, second = StorePersistence(store), StorePersistence(store)
+        await first.update_user_data(1, {'step': 'date'})
+        await first.flush()
+        data = (await second.get_user_data())[1]
+
+        await first.update_user_data(1, {'step': 'offer'})
+        await first.flush()
+        await second.refresh_user_data(1, data)
+        return data
+
+    assert run(scenario()) == {'step': 'offer'}
+
+def test_conflicting_write_is_replaced_by_owner_value():
+    async def scenario():
+        store = MemoryKeyValueStore()
+        owner, previous = StorePersistence(store), StorePersistence(store)
+        await owner.update_user_data(1, {'step': 'date'})
+        await owner.flush()
+        await previous.get_user_data()
+
+        # Written by the replica that served the user before
+        await previous.update_user_data(1, {'step': 'offer'})
+        await previous.flush()
+        await owner.update_user_data(1, {'step': 'fields'})
+        await owner.flush()
+        return store
+
+    store = run(scenario())
+    assert pickle.loads(store.data[(USER_DATA, '1')][0]) == {'step': 'fields'}
+
+def test_drop_deletes_key():
+    async def scenario():
+        store = MemoryKeyValueStore()
+        persistence = StorePersistence(store)
+        await persistence.update_user_data(1, {'step': 'date'})
+        await persistence.flush()
+        await persistence.drop_user_data(1)
+        await persistence.flush()
+        return store
+
+    assert run(scenario()).data == {}
+
+def test_failed_write_is_retried_without_new_changes(monkeypatch):
+    monkeypatch.setattr(persistence_module, 'PERSISTENCE_RETRY_DELAY', 0.01)
+
+    async def scenario():
+        store = FlakyStore(failures=2)
+        persistence = StorePersistence(store)
+        await persistence.update_user_data(1, {'step': 'date'})
+        await asyncio.sleep(0.2)
+        return store
+
+    store = run(scenario())
+    assert pickle.loads(store.data[(USER_DATA, '1')][0]) == {'step': 'date'}
+
+def test_keys_marked_during_write_are_written():
+    async def scenario():
+        store = FlakyStore(failures=0)
+        persistence = StorePersistence(store)
+        await persistence.update_user_data(1, {'step': 'date'})
+        await asyncio.sleep(0.005)
+        # First batch is being written now
+        await persistence.update_user_data(2, {'step': 'offer'})
+        await asyncio.sleep(0.1)
+        return store
+
+    store = run(scenario())
+    assert store.writes == 2
+    assert pickle.loads(store.data[(USER_DATA, '2')][0]) == {'step': 'offer'}
+
+def test_incomplete_store_cannot_be_created():
+    class ReadOnlyStore(KeyValueStore):
+        async def load(self, namespace):
+            return {}
+
+        async def get_changed(self, namespace, key, revision):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
\ No newline at end of file